@@ -1,17 +1,58 @@
 import numpy as np
-from bitstring import BitArray, BitStream, ReadError
+from bitstring import BitArray, ConstBitStream
+
+from hash_chain import HashChainMatchFinder
+from suffix_array import find_longest_previous_matches
+from bit_packing import pack_fixed_width_fields, unpack_fixed_width_fields, ROWS_PER_CHUNK
+from instrumentation import measure
+from token_format import write_tokens, expand_tokens, iter_expanded_tokens
+from expansion import iter_expanded_runs
+
+
+MATCH_FINDERS = ['window', 'hash_chain', 'suffix_array']
+##### Triples are written packed in bits, or as byte-aligned tokens.
+ENCODING_FORMATS = ['bits', 'tokens']
+
+##### Triples are saved in structured arrays with compact fields.
+TRIPLE_DTYPE = np.dtype([('offset', np.uint32), ('match_length', np.uint16), ('code', np.uint8)])
+MAX_LOOK_AHEAD_BUFFER_SIZE = np.iinfo(np.uint16).max + 1
+MAX_SEARCH_BUFFER_SIZE = np.iinfo(np.uint32).max
+##### Amount of decoded bytes yielded at once by the incremental decoding.
+CHUNK_SIZE = 1 << 16
 
 
 class LZ77():      
 
+    def __init__(self, stats=None):
+        ##### Symbols that precede the sequence. None by default.
+        self.primed_symbols = np.empty(0, dtype=np.uint8)
+        self.primed_match_finder = None
+        ##### Optional statistics, updated by encoding and decoding methods.
+        self.stats = stats
+
+
     ########## Public Methods
 
+    def prime_search_buffer(self, symbols, match_finder=None):
+        ##### Symbols known by both encoder and decoder before the sequence, so the first triples may refer to them.
+        self.primed_symbols = np.frombuffer(bytes(symbols), dtype=np.uint8)
+        ##### Hash chains already indexed over the symbols, for symbols primed many times, as preset dictionaries.
+        self.primed_match_finder = match_finder
+
+
     ##### Encoding Methods
 
-    def create_buffers(self, search_buffer_size, look_ahead_buffer_size):
+    def create_buffers(self, search_buffer_size, look_ahead_buffer_size, match_finder='window', chain_depth=256):
+        assert match_finder in MATCH_FINDERS, f"'match_finder' is supposed to be one of {MATCH_FINDERS}."
+        assert search_buffer_size <= MAX_SEARCH_BUFFER_SIZE, f"Search buffer can not be larger than {MAX_SEARCH_BUFFER_SIZE}."
+        assert look_ahead_buffer_size <= MAX_LOOK_AHEAD_BUFFER_SIZE, f"Look ahead buffer can not be larger than {MAX_LOOK_AHEAD_BUFFER_SIZE}."
         self.search_buffer_size = search_buffer_size
-        self.search_buffer = np.empty(search_buffer_size)
+        ##### The search buffer starts empty, since no symbol has been encoded yet.
+        self.search_buffer = np.empty(0, dtype=np.uint8)
         self.look_ahead_buffer_size = look_ahead_buffer_size
+        ##### Engine used for finding matches and maximum amount of candidates visited by the hash chains.
+        self.match_finder = match_finder
+        self.chain_depth = chain_depth
 
     def read_sequence(self, bytes_sequence):
         ##### Save sequence
@@ -29,41 +70,45 @@ class LZ77():
         return self.get_bitstring()
 
 
-    def generate_triples(self):
-        ##### Create look_ahead_buffer
-        self.look_ahead_buffer = self.sequence[:self.look_ahead_buffer_size]
-
-        ##### Create list for saving triples.
-        self.triples = []
+    def encode_sequence_as_tokens(self):
+        ##### Generate triples
+        self.generate_triples()
 
-        while len(self.sequence) is not 0:
-            triple = self.__generate_triple()
-            self.__update_buffers(triple[1])
-            self.triples.append(triple)
+        ##### Write triples as byte-aligned tokens
+        with measure(self.stats, 'token_writing'):
+            self.tokens = write_tokens(self.triples, self.sequence)
 
-        return self.triples    
+        return self.tokens
 
 
-    def write_triples_in_bitstring(self):
-        self.triples = np.array(self.triples)
+    def generate_triples(self):
+        ##### Primed symbols are placed before the sequence, and the encoding starts right after them.
+        self.primed_sequence = np.concatenate((self.primed_symbols, self.sequence)) if len(self.primed_symbols) else self.sequence
+        ##### Compared candidates are only counted for statistics.
+        self.count_candidates = self.stats is not None
+        self.compared_candidates = 0
+
+        ##### Find matches with the selected engine.
+        with measure(self.stats, 'match_finding'):
+            if self.match_finder == 'hash_chain':
+                self.__generate_triples_with_hash_chain()
+            elif self.match_finder == 'suffix_array':
+                self.__generate_triples_with_suffix_array()
+            else:
+                self.__generate_triples_with_window()
 
-        ##### Get maximum offset and match length values.
-        max_offset = self.triples[:, 0].max()
-        max_match_length = self.triples[:, 1].max()
+        ##### Update statistics. Only the primed sequence is copied, since buffers are views of it.
+        if self.stats is not None:
+            self.stats.record_triples(self.triples)
+            self.stats.count('compared_candidates', self.compared_candidates)
+            self.stats.count('moved_bytes', len(self.primed_sequence) if len(self.primed_symbols) else 0)
 
-        ##### Get amount of bits required to send offset and match length.
-        offset_bits_amount = len(bin(max_offset)[2:])
-        match_length_bits_amount = len(bin(max_match_length)[2:])
+        return self.triples
 
-        ##### Instantiate bitstring with header.
-        # NOTE: We use 5 bits to write the amount of bits that encode offset and match length info.
-        self.bitstring = BitArray(f'uint:5={offset_bits_amount}, uint:5={match_length_bits_amount}')
 
-        ##### Write triples in bitstring
-        for triple in self.triples:
-            self.bitstring.append(f'uint:{offset_bits_amount}={triple[0]}')
-            self.bitstring.append(f'uint:{match_length_bits_amount}={triple[1]}')
-            self.bitstring.append(f'uint:8={triple[2]}')
+    def write_triples_in_bitstring(self):
+        with measure(self.stats, 'bit_writing'):
+            self.__write_triples_in_bitstring()
 
         return
 
@@ -75,48 +120,227 @@ class LZ77():
     ##### Decoding Methods
 
     def read_triples(self, triples):
-        self.triples = triples
+        ##### Triples given as rows of three integers are converted to the compact representation.
+        self.triples = triples if triples.dtype == TRIPLE_DTYPE else create_triples(triples[:, 0], triples[:, 1], triples[:, 2])
 
     
     def decode_sequence_from_bitstring(self, bitstring):
         ##### Verify bitstring class
-        assert isinstance(bitstring, BitStream), "'bitstring object' is supposed to be an instance of BitStream class."
+        assert isinstance(bitstring, ConstBitStream), "'bitstring object' is supposed to be an instance of ConstBitStream class."
         
-        ##### Get amount of bits used for coding offsets and lengths
-        offset_bits_amount, match_length_bits_amount = bitstring.readlist('uint:5, uint:5')
+        with measure(self.stats, 'bit_reading'):
+            self.__read_triples_from_bitstring(bitstring)
 
-        ##### Read bitstring until its end and create decode sequence.
-        self.triples = []
-        self.decoded_sequence = [] 
+        return self.decode_sequence_from_triples()
 
-        while True:
-            try:
-                offset = bitstring.read(f'uint:{offset_bits_amount}')
-                match_length = bitstring.read(f'uint:{match_length_bits_amount}')
-                code = bitstring.read(f'uint:8')
-
-                self.triples.append([offset, match_length, code])
-                self.__insert_triple_in_decoded_sequence(offset, match_length, code)
-            except ReadError:
-                break
+    
+    def decode_sequence_from_tokens(self, tokens):
+        ##### Tokens are expanded after the primed symbols, which are not part of the decoded sequence.
+        with measure(self.stats, 'token_expansion'):
+            self.decoded_sequence = expand_tokens(tokens, self.primed_symbols.tobytes())
 
         return self.decoded_sequence
 
     
     def decode_sequence_from_triples(self):
-        ##### Instantiate empty sequence
-        self.decoded_sequence = []
+        with measure(self.stats, 'triples_expansion'):
+            self.__decode_sequence_from_triples()
 
-        ##### Construct sequence from triples
-        for triple in self.triples:
-            offset, match_length, code = triple
-            self.__insert_triple_in_decoded_sequence(int(offset), int(match_length), int(code))
+        ##### Update statistics. Primed symbols and matches are copied within the decoded sequence.
+        if self.stats is not None:
+            self.stats.record_triples(self.triples)
+            self.stats.count('moved_bytes', len(self.primed_symbols) + int(self.triples['match_length'].sum(dtype=np.int64)))
 
         return self.decoded_sequence
 
 
+    ##### Incremental Decoding Methods
+
+    # NOTE: These generators yield the decoded sequence in chunks of about 'chunk_size' bytes, as soon as
+    #       they are decoded. Triples and tokens are parsed in chunks of ROWS_PER_CHUNK rows as they are
+    #       expanded, and only the last 'history_size' decoded bytes are kept, so memory does not grow with
+    #       the decoded sequence. 'history_size' must be at least the search buffer size used by the encoder.
+
+    def iter_sequence_from_bitstring(self, bitstring, history_size, chunk_size=CHUNK_SIZE):
+        assert isinstance(bitstring, ConstBitStream), "'bitstring object' is supposed to be an instance of ConstBitStream class."
+
+        return self.__iter_expanded_triples(self.__iter_triples_from_bitstring(bitstring), history_size, chunk_size)
+
+
+    def iter_sequence_from_tokens(self, tokens, history_size, chunk_size=CHUNK_SIZE):
+        return iter_expanded_tokens(tokens, self.primed_symbols.tobytes(), history_size, chunk_size)
+
+
+    def iter_sequence_from_triples(self, history_size, chunk_size=CHUNK_SIZE):
+        ##### Triples already read are also expanded in chunks, so only one chunk of them is converted at once.
+        triples_chunks = (self.triples[chunk_start:chunk_start + ROWS_PER_CHUNK] for chunk_start in range(0, len(self.triples), ROWS_PER_CHUNK))
+        return self.__iter_expanded_triples(triples_chunks, history_size, chunk_size)
+
+
     ########## Private Methods
 
+    def __generate_triples_with_window(self):
+        ##### Create buffers. Both buffers are views of the sequence delimited by the current position.
+        self.position = len(self.primed_symbols)
+        self.search_buffer = self.primed_sequence[max(0, self.position - self.search_buffer_size):self.position]
+        self.look_ahead_buffer = self.primed_sequence[self.position:self.position + self.look_ahead_buffer_size]
+
+        ##### Create array for saving triples.
+        self.__create_triples_array()
+
+        while self.position < len(self.primed_sequence):
+            triple = self.__generate_triple()
+            self.__update_buffers(triple[1])
+            self.__append_triple(*triple)
+
+        return self.__get_triples_array()
+
+
+    def __write_triples_in_bitstring(self):
+        ##### Get maximum offset and match length values.
+        max_offset = self.triples['offset'].max(initial=0)
+        max_match_length = self.triples['match_length'].max(initial=0)
+
+        ##### Get amount of bits required to send offset and match length.
+        offset_bits_amount = len(bin(max_offset)[2:])
+        match_length_bits_amount = len(bin(max_match_length)[2:])
+
+        ##### Instantiate bitstring with header.
+        # NOTE: We use 5 bits to write the amount of bits that encode offset and match length info.
+        self.bitstring = BitArray(f'uint:5={offset_bits_amount}, uint:5={match_length_bits_amount}')
+
+        ##### Write triples in bitstring. All of them are packed at once.
+        packed_triples, bits_amount = pack_fixed_width_fields([self.triples['offset'], self.triples['match_length'], self.triples['code']],
+                                                              [offset_bits_amount, match_length_bits_amount, 8])
+        self.bitstring.append(BitArray(bytes=packed_triples, length=bits_amount))
+
+        return
+
+
+    def __read_triples_from_bitstring(self, bitstring):
+        triple_widths, triples_amount = self.__read_triples_header(bitstring)
+
+        ##### Read all triples at once and create decode sequence.
+        offsets, match_lengths, codes = unpack_fixed_width_fields(bitstring[bitstring.pos:].tobytes(), triple_widths, triples_amount)
+        bitstring.pos += triples_amount * sum(triple_widths)
+        self.triples = create_triples(offsets, match_lengths, codes)
+
+        return
+
+
+    def __iter_triples_from_bitstring(self, bitstring):
+        triple_widths, triples_amount = self.__read_triples_header(bitstring)
+
+        ##### Read triples in chunks of rows. Only the bits of the current chunk are unpacked.
+        for chunk_start in range(0, triples_amount, ROWS_PER_CHUNK):
+            chunk_rows = min(ROWS_PER_CHUNK, triples_amount - chunk_start)
+            with measure(self.stats, 'bit_reading'):
+                chunk_bits = bitstring.read(chunk_rows * sum(triple_widths))
+                triples = create_triples(*unpack_fixed_width_fields(chunk_bits.tobytes(), triple_widths, chunk_rows))
+            yield triples
+
+
+    def __read_triples_header(self, bitstring):
+        ##### Get amount of bits used for coding offsets and lengths
+        offset_bits_amount, match_length_bits_amount = bitstring.readlist('uint:5, uint:5')
+
+        ##### Every triple has the same width, so the amount of triples is known in advance.
+        #     Bits left after the last complete triple are padding.
+        triple_widths = [offset_bits_amount, match_length_bits_amount, 8]
+        triples_amount = (len(bitstring) - bitstring.pos) // sum(triple_widths)
+
+        return triple_widths, triples_amount
+
+
+    def __decode_sequence_from_triples(self):
+        ##### The whole sequence is expanded as a single chunk, after the primed symbols.
+        primed_symbols = self.primed_symbols.tobytes()
+        self.decoded_sequence = b''.join(iter_expanded_runs([get_triples_runs(self.triples)], primed_symbols, len(primed_symbols),
+                                                            literals_first=False))
+
+        return
+
+
+    def __generate_triples_with_hash_chain(self):
+        ##### Instantiate match finder. Primed hash chains are extended with the sequence, instead of indexing the symbols again.
+        if self.primed_match_finder is not None:
+            match_finder = self.primed_match_finder.extend(self.primed_sequence, self.count_candidates)
+        else:
+            match_finder = HashChainMatchFinder(self.primed_sequence, self.search_buffer_size, self.chain_depth, self.count_candidates)
+        sequence = match_finder.sequence
+        sequence_length = len(sequence)
+
+        ##### Create array for saving triples.
+        self.__create_triples_array()
+
+        position = len(self.primed_symbols)
+        while position < sequence_length:
+            ##### The last symbol of the look ahead buffer is always sent as code.
+            max_match_length = min(self.look_ahead_buffer_size, sequence_length - position) - 1
+            offset, match_length = match_finder.find_longest_match(position, max_match_length)
+            self.__append_triple(offset, match_length, sequence[position + match_length])
+            position += match_length + 1
+
+        self.compared_candidates = match_finder.compared_candidates
+        return self.__get_triples_array()
+
+
+    def __generate_triples_with_suffix_array(self):
+        ##### Longest previous match of every position, found at once.
+        match_positions, match_lengths = find_longest_previous_matches(self.primed_sequence, self.search_buffer_size,
+                                                                       self.look_ahead_buffer_size, len(self.primed_symbols))
+        match_positions, match_lengths = match_positions.tolist(), match_lengths.tolist()
+        sequence = bytes(self.primed_sequence)
+        sequence_length = len(sequence)
+
+        ##### Create array for saving triples.
+        self.__create_triples_array()
+
+        ##### Parse the sequence with the matches. Matches may overlap the look ahead buffer, as in the decoding.
+        position = len(self.primed_symbols)
+        while position < sequence_length:
+            ##### The last symbol of the look ahead buffer is always sent as code.
+            max_match_length = min(self.look_ahead_buffer_size, sequence_length - position) - 1
+            match_length = min(match_lengths[position], max_match_length)
+            offset = position - match_positions[position] if match_length else 0
+            self.__append_triple(offset, match_length, sequence[position + match_length])
+            position += match_length + 1
+
+        return self.__get_triples_array()
+
+
+    def __create_triples_array(self):
+        ##### The array starts with room for a fraction of the sequence and grows when it is full.
+        self.triples = np.empty(max(len(self.sequence) // 8, 1), dtype=TRIPLE_DTYPE)
+        self.triples_amount = 0
+        self.__get_triples_fields()
+
+
+    def __get_triples_fields(self):
+        ##### Views of each field, which are faster to assign than whole records.
+        self.offsets = self.triples['offset']
+        self.match_lengths = self.triples['match_length']
+        self.codes = self.triples['code']
+
+
+    def __append_triple(self, offset, match_length, code):
+        ##### Double the array capacity if it is full.
+        if self.triples_amount == len(self.triples):
+            self.triples = np.concatenate((self.triples, np.empty(len(self.triples), dtype=TRIPLE_DTYPE)))
+            self.__get_triples_fields()
+
+        self.offsets[self.triples_amount] = offset
+        self.match_lengths[self.triples_amount] = match_length
+        self.codes[self.triples_amount] = code
+        self.triples_amount += 1
+
+
+    def __get_triples_array(self):
+        ##### Drop the unused capacity.
+        self.triples = self.triples[:self.triples_amount]
+        del self.offsets, self.match_lengths, self.codes
+        return self.triples
+
 
     def __generate_triple(self):
         ##### check if only one element is missing in the look ahead buffer.
@@ -130,6 +354,8 @@ class LZ77():
         #     ahead buffer while matches in the search buffer are found.
         for sequence_length in range(1, len(self.look_ahead_buffer)):
             sequence_to_be_found = self.look_ahead_buffer[:sequence_length]
+            if self.count_candidates:
+                self.compared_candidates += max(len(self.search_buffer) - sequence_length + 1, 0)
             ##### Get indexes where the current sequence is founded in the search buffer.
             founded_indexes = np.where(np.all(self.__rolling_window(sequence_length) == sequence_to_be_found, axis=1) == True)[0]
 
@@ -144,7 +370,7 @@ class LZ77():
                 #     sequence with one element less was found in the search buffer.
                 else:
                     seq_index = last_founded_indexes[-1]
-                    offset = self.search_buffer_size - seq_index
+                    offset = len(self.search_buffer) - seq_index
                     match_length = sequence_length - 1
                     symbol = sequence_to_be_found[-1]
                     break
@@ -153,11 +379,13 @@ class LZ77():
             #     to check the size of the match from that index.
             elif founded_indexes.shape[0] is 1:
                 seq_index = founded_indexes[-1]
-                offset = self.search_buffer_size - seq_index
+                offset = len(self.search_buffer) - seq_index
                 ##### Grow the sequence size as long as the match is true.
                 sequence_length += 1
                 sequence_to_be_found = self.look_ahead_buffer[:sequence_length]
-                while ((np.sum(self.search_buffer[seq_index: seq_index + sequence_length] == sequence_to_be_found) == sequence_length)
+                ##### The match can not grow beyond the end of the search buffer.
+                while ((seq_index + sequence_length <= len(self.search_buffer))
+                            and np.array_equal(self.search_buffer[seq_index: seq_index + sequence_length], sequence_to_be_found)
                             and (sequence_length < len(self.look_ahead_buffer))):
                     sequence_length += 1
                     sequence_to_be_found = self.look_ahead_buffer[:sequence_length]
@@ -171,7 +399,7 @@ class LZ77():
         ##### If sequence length has achieved the greatest value, you assign the largest
         #     possible offset and encode the last symbol of the look ahead buffer.
         if (offset and match_length and symbol) is None:
-            offset = self.search_buffer_size - founded_indexes[-1]
+            offset = len(self.search_buffer) - founded_indexes[-1]
             match_length = sequence_length
             symbol = self.look_ahead_buffer[-1]
 
@@ -180,32 +408,43 @@ class LZ77():
 
 
     def __update_buffers(self, match_length):
-        search_buffer_tail, self.sequence = np.split(self.sequence, [match_length + 1])
-        self.search_buffer = np.concatenate((self.search_buffer[match_length + 1:], search_buffer_tail.astype(np.float64)))
-        self.look_ahead_buffer = self.sequence[:self.look_ahead_buffer_size]
+        ##### Advance the current position. Buffers are re-sliced from the sequence, so nothing is copied.
+        self.position += match_length + 1
+        self.search_buffer = self.primed_sequence[max(0, self.position - self.search_buffer_size):self.position]
+        self.look_ahead_buffer = self.primed_sequence[self.position:self.position + self.look_ahead_buffer_size]
 
 
     def __rolling_window(self, window_size):
-        shape = self.search_buffer.shape[:-1] + (self.search_buffer.shape[-1] - window_size + 1, window_size)
+        ##### While the search buffer is shorter than the window, there are no candidate positions.
+        shape = self.search_buffer.shape[:-1] + (max(self.search_buffer.shape[-1] - window_size + 1, 0), window_size)
         strides = self.search_buffer.strides + (self.search_buffer.strides[-1],)
         return np.lib.stride_tricks.as_strided(self.search_buffer, shape=shape, strides=strides)
 
     
-    def __insert_triple_in_decoded_sequence(self, offset, match_length, code):
-        ##### If offset is null, just write the code in the sequence.
-        if (offset or match_length) == 0:
-            self.decoded_sequence.append(code)
-            return
-        ##### Else, the pattern needs to be recovered and appended in the sequence jointly with the code.
-        elif offset <= match_length:
-            founded_pattern = self.decoded_sequence[-offset:]
-            ##### If match length is greater than offset, then the reading process should continue within the founded pattern.
-            if match_length > offset:
-                for look_ahead_buffer_idx in range(match_length - offset):
-                    founded_pattern.append(founded_pattern[look_ahead_buffer_idx])
-        else:
-            founded_pattern = self.decoded_sequence[(-offset):(-offset + match_length)]
-        
-        self.decoded_sequence += founded_pattern + [code]
+    def __iter_expanded_triples(self, triples_chunks, history_size, chunk_size):
+        ##### Each triple is a run whose match is followed by a single literal, its code.
+        return iter_expanded_runs(map(self.__get_recorded_triples_runs, triples_chunks), self.primed_symbols.tobytes(), history_size,
+                                  chunk_size, literals_first=False)
+
+
+    def __get_recorded_triples_runs(self, triples):
+        if self.stats is not None:
+            self.stats.record_triples(triples)
+        return get_triples_runs(triples)
+
+
+
+########## Auxiliary Methods
+
+def get_triples_runs(triples):
+    ##### Literal counts, offsets, match lengths and literals of the runs decoded by the triples.
+    return np.ones(len(triples), dtype=np.int64), triples['offset'], triples['match_length'], triples['code'].tobytes()
+
 
-        return
\ No newline at end of file
+def create_triples(offsets, match_lengths, codes):
+    ##### Create a structured array of triples from its fields.
+    triples = np.empty(len(offsets), dtype=TRIPLE_DTYPE)
+    triples['offset'] = offsets
+    triples['match_length'] = match_lengths
+    triples['code'] = codes
+    return triples
@@ -0,0 +1,334 @@
+import os
+import sys
+import json
+import time
+import resource
+import platform
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from LZ77 import MATCH_FINDERS
+from image_filters import IMAGE_FILTERS
+from compressibility import compute_entropy
+from encoder import Encoder
+from decoder import Decoder
+
+
+##### Default benchmark grid. The largest value of each pair is the size of the Search Buffer.
+BUFFER_SIZES = [[255, 15], [4095, 255], [65535, 255]]
+CORPUS_SEED = 77
+IMAGE_WIDTH = 256
+
+WORDS = ['the', 'of', 'and', 'to', 'in', 'a', 'is', 'that', 'for', 'it', 'as', 'was', 'with', 'be', 'by', 'on', 'not',
+         'he', 'this', 'are', 'or', 'his', 'from', 'at', 'which', 'but', 'have', 'an', 'had', 'they', 'you', 'were',
+         'their', 'one', 'all', 'we', 'can', 'her', 'has', 'there', 'been', 'if', 'more', 'when', 'will', 'would',
+         'who', 'so', 'no', 'compression', 'buffer', 'window', 'symbol', 'sequence', 'search', 'match', 'length']
+LOG_LEVELS = ['INFO', 'INFO', 'INFO', 'DEBUG', 'WARNING', 'ERROR']
+LOG_MESSAGES = ['request served in {} ms', 'cache miss for key {}', 'connection {} closed by peer',
+                'worker {} started', 'retrying job {} after timeout']
+
+##### Command lines of the startup benchmark, run by the unified command line on a small file.
+STARTUP_CASES = {'help': ['--help'],
+                 'encode': ['encode', '--file_to_compress', '{text_file}', '--binary_file_path', '{binary_file}',
+                            '--search_buffer_length', '255', '--look_ahead_buffer_length', '15'],
+                 'encode_second_step': ['encode', '--file_to_compress', '{text_file}', '--binary_file_path', '{binary_file}',
+                                        '--search_buffer_length', '255', '--look_ahead_buffer_length', '15', '--second_encoding_step'],
+                 'decode': ['decode', '--binary_file_path', '{binary_file}', '--decoded_file_path', '{decoded_file}']}
+STARTUP_FILE_SIZE = 1 << 10
+HEAVIEST_IMPORTS_AMOUNT = 5
+
+
+########## Corpus Generation
+
+# NOTE: Every file is generated from a fixed seed, so the corpus is the same on every machine.
+
+def generate_text(rng, size):
+    ##### Words follow a Zipf-like distribution, so frequent words repeat as in English.
+    probabilities = 1 / np.arange(1, len(WORDS) + 1)
+    words = rng.choice(WORDS, size=size // 4, p=probabilities / probabilities.sum())
+    text = ' '.join(words).encode()
+    return text[:size]
+
+
+def generate_random_bytes(rng, size):
+    return rng.integers(0, 256, size=size, dtype=np.uint8).tobytes()
+
+
+def generate_logs(rng, size):
+    ##### Lines share a few templates and have increasing timestamps.
+    lines, length, timestamp = [], 0, 1600000000
+    while length < size:
+        timestamp += int(rng.integers(0, 3))
+        message = LOG_MESSAGES[rng.integers(len(LOG_MESSAGES))].format(int(rng.integers(1000)))
+        line = f'{timestamp} [{LOG_LEVELS[rng.integers(len(LOG_LEVELS))]}] {message}\n'
+        lines.append(line)
+        length += len(line)
+    return ''.join(lines).encode()[:size]
+
+
+def generate_image(rng, size, channels):
+    ##### Smooth gradients with a little noise, similar to natural images.
+    height = max(size // (IMAGE_WIDTH * channels), 1)
+    rows, columns = np.mgrid[0:height, 0:IMAGE_WIDTH]
+    planes = [(rows * (channel + 1) + columns * (3 - channel)) // 4 for channel in range(channels)]
+    image = np.stack(planes, axis=-1) + rng.integers(-2, 3, size=(height, IMAGE_WIDTH, channels))
+    return np.squeeze(np.clip(image, 0, 255).astype(np.uint8))
+
+
+def generate_corpus(corpus_directory, size):
+    ##### Create directory.
+    corpus_directory = Path(corpus_directory)
+    if not corpus_directory.exists():
+        corpus_directory.mkdir(parents=True)
+
+    ##### Text files are written as they are. Images are saved in the formats read by the encoder.
+    rng = np.random.default_rng(CORPUS_SEED)
+    corpus = {'english.txt': generate_text(rng, size), 'random.txt': generate_random_bytes(rng, size),
+              'logs.txt': generate_logs(rng, size), 'grayscale.bmp': generate_image(rng, size, 1),
+              'rgb.png': generate_image(rng, size, 3)}
+
+    file_paths = []
+    for file_name, content in corpus.items():
+        file_path = os.path.join(corpus_directory, file_name)
+        if isinstance(content, bytes):
+            with open(file_path, "wb") as corpus_file:
+                corpus_file.write(content)
+        else:
+            ##### PIL is only imported to write the images, so it is not loaded when the benchmark starts.
+            from PIL import Image
+            Image.fromarray(content).save(file_path)
+        file_paths.append(file_path)
+
+    return file_paths
+
+
+
+########## Measurements
+
+def run_case(file_path, search_buffer_size, look_ahead_buffer_size, second_encoding_step, match_finder, image_filter, repeats):
+    # NOTE: Each case runs in a new process, so the peak resident memory is only due to the case itself.
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        binary_file_path = os.path.join(temporary_directory, 'benchmark.bin')
+
+        ##### The fastest of the repetitions is kept.
+        encoding_time = decoding_time = float('inf')
+        for _ in range(repeats):
+            with Encoder(file_path, image_filter=image_filter) as encoder:
+                encoding_start = time.perf_counter()
+                encoder.encode_sequence(search_buffer_size, look_ahead_buffer_size, second_encoding_step, match_finder)
+                encoder.save_binary_file(binary_file_path)
+                encoding_time = min(encoding_time, time.perf_counter() - encoding_start)
+
+                decoder = Decoder(binary_file_path)
+                decoding_start = time.perf_counter()
+                decoder.decode_bitstring()
+                decoding_time = min(decoding_time, time.perf_counter() - decoding_start)
+
+                ##### Verify reconstruction. For images, the filtered sequence is compared.
+                assert decoder.sequence == bytes(encoder.sequence), f"Decoded {file_path} does not match the original content."
+                entropy = compute_entropy(encoder.sequence)
+
+    ##### Linux reports the peak resident memory in KB.
+    original_bytes = encoder.sequence_length
+    megabytes = original_bytes / 1e6
+    return {'file': os.path.basename(file_path), 'search_buffer_size': search_buffer_size,
+            'look_ahead_buffer_size': look_ahead_buffer_size, 'second_encoding_step': second_encoding_step,
+            'match_finder': match_finder, 'image_filter': image_filter, 'original_bytes': original_bytes, 'binary_bytes': encoder.binary_file_size,
+            'compression_ratio': original_bytes / encoder.binary_file_size, 'rate': encoder.compute_rate(),
+            'entropy': entropy, 'encode_MBps': megabytes / encoding_time,
+            'decode_MBps': megabytes / decoding_time, 'peak_rss_MB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def run_benchmark(file_paths, buffer_sizes, match_finder, image_filter, repeats):
+    results = []
+    for file_path in file_paths:
+        for search_buffer_size, look_ahead_buffer_size in buffer_sizes:
+            for second_encoding_step in [False, True]:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(run_case, file_path, search_buffer_size, look_ahead_buffer_size,
+                                             second_encoding_step, match_finder, image_filter, repeats).result()
+                print_result(result)
+                results.append(result)
+
+    return results
+
+
+
+########## Startup Measurements
+
+# NOTE: Short jobs are dominated by the start of the interpreter and the imports. Each case runs the
+#       unified command line in a new interpreter. The fastest run is kept, and one more run with
+#       '-X importtime' gives the time spent importing each top-level module.
+
+def run_startup_case(argv, repeats):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lz77_cli.py')] + argv
+
+    ##### The fastest of the repetitions is kept.
+    seconds = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    ##### Each line of the import report has the self and cumulative microseconds of a module, whose name is
+    #     indented by its nesting level. Top-level imports add up to the whole import time.
+    report = subprocess.run([sys.executable, '-X', 'importtime'] + command[1:], check=True, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True).stderr
+    imports = [line.split('|') for line in report.splitlines() if line.startswith('import time:') and 'imported package' not in line]
+    top_level_imports = {fields[2][1:]: int(fields[1]) for fields in imports if not fields[2][1:].startswith(' ')}
+    heaviest_imports = sorted(top_level_imports.items(), key=lambda item: item[1], reverse=True)[:HEAVIEST_IMPORTS_AMOUNT]
+
+    return {'seconds': seconds, 'import_seconds': sum(top_level_imports.values()) / 1e6, 'modules': len(imports),
+            'heaviest_imports_ms': {name: microseconds / 1e3 for name, microseconds in heaviest_imports}}
+
+
+def run_startup_benchmark(repeats):
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        ##### Small text file, so the coding itself takes a negligible time.
+        file_paths = {'text_file': os.path.join(temporary_directory, 'startup.txt'),
+                      'binary_file': os.path.join(temporary_directory, 'startup.bin'),
+                      'decoded_file': os.path.join(temporary_directory, 'startup_decoded')}
+        with open(file_paths['text_file'], "wb") as text_file:
+            text_file.write(generate_text(np.random.default_rng(CORPUS_SEED), STARTUP_FILE_SIZE))
+
+        ##### Cases run in order, so the binary file exists before it is decoded.
+        results = []
+        for case, argv in STARTUP_CASES.items():
+            result = dict(case=case, **run_startup_case([argument.format(**file_paths) for argument in argv], repeats))
+            print_startup_result(result)
+            results.append(result)
+
+    return results
+
+
+
+########## Comparison
+
+def case_key(result):
+    ##### Startup cases are only identified by their name.
+    if 'case' in result:
+        return result['case']
+    return (result['file'], result['search_buffer_size'], result['look_ahead_buffer_size'],
+            result['second_encoding_step'], result['match_finder'], result.get('image_filter', 'none'))
+
+
+def compare_results(baseline_path, current_path, threshold):
+    ##### Read both result files.
+    with open(baseline_path) as baseline_file:
+        baseline_results = json.load(baseline_file)
+    with open(current_path) as current_file:
+        current_results = json.load(current_file)
+
+    ##### A startup case regresses when it gets slower by more than the threshold.
+    if 'startup' in current_results:
+        return compare_startup_results(baseline_results['startup'], current_results['startup'], threshold)
+    baseline = {case_key(result): result for result in baseline_results['results']}
+    current = current_results['results']
+
+    ##### A case regresses when its throughput drops by more than the threshold.
+    regressions = 0
+    for result in current:
+        baseline_result = baseline.get(case_key(result))
+        if baseline_result is None:
+            continue
+        for metric in ['encode_MBps', 'decode_MBps']:
+            ratio = result[metric] / baseline_result[metric]
+            regressions += ratio < 1 - threshold
+            print(f"{result['file']:>14} S={result['search_buffer_size']:<6} L={result['look_ahead_buffer_size']:<4} "
+                  f"2nd={int(result['second_encoding_step'])} {metric:>12}: {baseline_result[metric]:9.3f} -> "
+                  f"{result[metric]:9.3f} MB/s ({ratio - 1:+.1%}){' REGRESSION' if ratio < 1 - threshold else ''}")
+
+    return not regressions
+
+
+def compare_startup_results(baseline, current, threshold):
+    baseline = {case_key(result): result for result in baseline}
+
+    regressions = 0
+    for result in current:
+        baseline_result = baseline.get(case_key(result))
+        if baseline_result is None:
+            continue
+        ratio = result['seconds'] / baseline_result['seconds']
+        regressions += ratio > 1 + threshold
+        print(f"{result['case']:>20}: {baseline_result['seconds']:7.3f} -> {result['seconds']:7.3f} s ({ratio - 1:+.1%})"
+              f"{' REGRESSION' if ratio > 1 + threshold else ''}")
+
+    return not regressions
+
+
+
+########## Auxiliary Methods
+
+def print_result(result):
+    print(f"{result['file']:>14} S={result['search_buffer_size']:<6} L={result['look_ahead_buffer_size']:<4} "
+          f"2nd={int(result['second_encoding_step'])} | ratio {result['compression_ratio']:6.3f} | "
+          f"rate {result['rate']:6.3f} / entropy {result['entropy']:6.3f} bits | "
+          f"encode {result['encode_MBps']:8.3f} MB/s | decode {result['decode_MBps']:8.3f} MB/s | "
+          f"peak RSS {result['peak_rss_MB']:7.1f} MB")
+
+
+def print_startup_result(result):
+    heaviest_imports = ', '.join(f'{name} {milliseconds:.0f} ms' for name, milliseconds in result['heaviest_imports_ms'].items())
+    print(f"{result['case']:>20} | {result['seconds']:7.3f} s | imports {result['import_seconds']:7.3f} s "
+          f"({result['modules']} modules) | heaviest: {heaviest_imports}")
+
+
+def get_metadata(args):
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'corpus_size': args.corpus_size, 'corpus_seed': CORPUS_SEED,
+            'match_finder': args.match_finder, 'image_filter': args.image_filter, 'repeats': args.repeats}
+
+
+
+def create_parser(prog=None):
+    ##### Receives benchmark parameters from command line.
+    parser = argparse.ArgumentParser(prog=prog, description="Benchmarks LZ77 coding on a generated corpus, or compares two benchmark results.")
+
+    parser.add_argument('--output', default='benchmark_results.json', help='Path to save the JSON results.')
+    parser.add_argument('--corpus_directory', default='benchmark_files', help="Directory for the generated corpus. "
+                                                                              "If folders do not exist, they'll be created.")
+    parser.add_argument('--corpus_size', default=1 << 16, type=int, help='Approximate amount of bytes of each corpus file.')
+    parser.add_argument('--buffer_sizes', nargs='+', type=int, help='Pairs of search and look ahead buffer sizes. '
+                                                                    f'Defaults to {BUFFER_SIZES}.')
+    parser.add_argument('--match_finder', default='hash_chain', choices=MATCH_FINDERS, help='Engine used for finding matches.')
+    parser.add_argument('--image_filter', default='none', choices=IMAGE_FILTERS, help='Prediction filter applied to the rows of images.')
+    parser.add_argument('--repeats', default=3, type=int, help='Amount of repetitions of each case. The fastest one is kept.')
+    parser.add_argument('--startup', action='store_true', help='Measure the startup and import times of the command line '
+                                                               'subcommands instead of the coding throughput.')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='Compare two JSON results instead of benchmarking.')
+    parser.add_argument('--threshold', default=0.1, type=float, help='Largest throughput drop, or startup time increase, accepted by the comparison.')
+
+    return parser
+
+
+def main(args):
+    ##### Compare results. Regressions fail the process.
+    if args.compare:
+        sys.exit(0 if compare_results(*args.compare, args.threshold) else 1)
+
+    ##### Benchmark startup of the command line.
+    if args.startup:
+        with open(args.output, "w") as output_file:
+            json.dump({'metadata': get_metadata(args), 'startup': run_startup_benchmark(args.repeats)}, output_file, indent=4)
+        return
+
+    ##### Define buffers sizes
+    buffer_sizes = np.reshape(args.buffer_sizes, (-1, 2)).tolist() if args.buffer_sizes else BUFFER_SIZES
+
+    ##### Benchmark corpus and save results.
+    file_paths = generate_corpus(args.corpus_directory, args.corpus_size)
+    results = run_benchmark(file_paths, buffer_sizes, args.match_finder, args.image_filter, args.repeats)
+    with open(args.output, "w") as output_file:
+        json.dump({'metadata': get_metadata(args), 'results': results}, output_file, indent=4)
+
+
+
+if __name__ == "__main__":
+    ##### Read command line
+    main(create_parser().parse_args(sys.argv[1:]))
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+########## Fixed Width Fields
+
+# NOTE: Rows are packed in chunks whose amount of bits is always a multiple of 8,
+#       so chunks can be concatenated as bytes while memory usage stays bounded.
+ROWS_PER_CHUNK = 1 << 16
+
+
+def pack_fixed_width_fields(fields, widths):
+    ##### Fields are columns of unsigned integers. Each row is written as the concatenation of its fields.
+    fields = [np.asarray(field) for field in fields]
+    rows_amount = len(fields[0]) if fields else 0
+    bits_amount = rows_amount * sum(widths)
+
+    ##### Shifts that expose the bits of each field, from the most to the least significant.
+    shifts = [np.arange(width - 1, -1, -1, dtype=np.uint64) for width in widths]
+
+    packed_chunks = []
+    for chunk_start in range(0, rows_amount, ROWS_PER_CHUNK):
+        chunk_end = chunk_start + ROWS_PER_CHUNK
+        ##### Build the bit matrix of the chunk, with one row per triple.
+        bits = np.hstack([((field[chunk_start:chunk_end, None].astype(np.uint64) >> shift) & 1).astype(np.uint8)
+                          for field, shift in zip(fields, shifts)])
+        packed_chunks.append(np.packbits(bits.ravel()).tobytes())
+
+    return b''.join(packed_chunks), bits_amount
+
+
+def unpack_fixed_width_fields(packed_bytes, widths, rows_amount):
+    ##### Inverse of 'pack_fixed_width_fields': returns one column of unsigned integers per field.
+    row_width = sum(widths)
+    bits_per_chunk = ROWS_PER_CHUNK * row_width
+    field_limits = np.cumsum([0] + list(widths))
+    ##### Weights of the bits of each field, from the most to the least significant.
+    weights = [np.uint64(1) << np.arange(width - 1, -1, -1, dtype=np.uint64) for width in widths]
+
+    fields = [np.empty(rows_amount, dtype=np.uint64) for _ in widths]
+    packed_bytes = np.frombuffer(packed_bytes, dtype=np.uint8)
+    for chunk_start in range(0, rows_amount, ROWS_PER_CHUNK):
+        chunk_rows = min(ROWS_PER_CHUNK, rows_amount - chunk_start)
+        first_byte = (chunk_start // ROWS_PER_CHUNK) * (bits_per_chunk // 8)
+        ##### Recover the bit matrix of the chunk, discarding the padding of the last byte.
+        bits = np.unpackbits(packed_bytes[first_byte:first_byte + (chunk_rows * row_width + 7) // 8])
+        bits = bits[:chunk_rows * row_width].reshape(chunk_rows, row_width).astype(np.uint64)
+        for field, start, end, weight in zip(fields, field_limits[:-1], field_limits[1:], weights):
+            field[chunk_start:chunk_start + chunk_rows] = bits[:, start:end] @ weight
+
+    return fields
+
+
+########## Variable Width Fields
+
+def pack_variable_width_fields(values, widths):
+    ##### Each value is written with its own amount of bits, one after the other.
+    values = np.asarray(values)
+    widths = np.asarray(widths)
+    bits_amount = int(widths.sum())
+
+    packed_chunks = []
+    carried_bits = np.empty(0, dtype=np.uint8)
+    for chunk_start in range(0, len(values), ROWS_PER_CHUNK):
+        chunk_values = values[chunk_start:chunk_start + ROWS_PER_CHUNK].astype(np.uint64)
+        chunk_widths = widths[chunk_start:chunk_start + ROWS_PER_CHUNK].astype(np.int64)
+
+        ##### Bits left from the previous chunk come first. Then, the j-th bit of every value
+        #     longer than j bits is written at once.
+        value_starts = len(carried_bits) + np.cumsum(chunk_widths) - chunk_widths
+        bits = np.empty(len(carried_bits) + int(chunk_widths.sum()), dtype=np.uint8)
+        bits[:len(carried_bits)] = carried_bits
+        for bit in range(int(chunk_widths.max(initial=0))):
+            longer = chunk_widths > bit
+            shifts = (chunk_widths[longer] - 1 - bit).astype(np.uint64)
+            bits[value_starts[longer] + bit] = (chunk_values[longer] >> shifts) & 1
+
+        ##### Pack whole bytes and carry the remaining bits to the next chunk.
+        whole_bits = len(bits) - len(bits) % 8
+        packed_chunks.append(np.packbits(bits[:whole_bits]).tobytes())
+        carried_bits = bits[whole_bits:]
+
+    packed_chunks.append(np.packbits(carried_bits).tobytes())
+
+    return b''.join(packed_chunks), bits_amount
@@ -0,0 +1,163 @@
+import heapq
+import numpy as np
+from bitstring import BitArray
+
+from bit_packing import pack_fixed_width_fields, unpack_fixed_width_fields, pack_variable_width_fields
+
+
+# NOTE: Code lengths are limited, so decoding tables stay small. The limit only grows for
+#       alphabets too large to be coded with it, up to the largest length read at once.
+MAX_CODE_LENGTH = 16
+MAX_CODE_LENGTH_LIMIT = 24
+CODE_LENGTH_BITS = 5
+HISTOGRAM_SIZE_LIMIT = 1 << 20
+
+
+########## Static Canonical Huffman Encoding Class
+
+class CanonicalHuffmanEncoder():
+
+    def read_sequence_array(self, sequence):
+        ##### Get alphabet and symbol frequencies. Small symbols are counted directly in a histogram.
+        self.sequence = np.asarray(sequence)
+        if len(self.sequence) and self.sequence.max() < HISTOGRAM_SIZE_LIMIT:
+            histogram = np.bincount(self.sequence)
+            self.symbols = np.flatnonzero(histogram)
+            self.counts = histogram[self.symbols]
+        else:
+            self.symbols, self.counts = np.unique(self.sequence, return_counts=True)
+
+
+    def encode(self):
+        ##### Compute canonical codes.
+        code_length_limit = min(max(MAX_CODE_LENGTH, len(self.symbols).bit_length()), MAX_CODE_LENGTH_LIMIT)
+        self.code_lengths = compute_code_lengths(self.counts, code_length_limit)
+        self.codes = compute_canonical_codes(self.code_lengths)
+
+        ##### Write alphabet size and symbol width.
+        symbols_amount = len(self.symbols)
+        bits_to_write_symbols_amount = len(bin(symbols_amount)[2:])
+        symbol_bits_amount = len(bin(int(self.symbols.max(initial=0)))[2:])
+        self.bitstring = BitArray(f'uint:5={bits_to_write_symbols_amount}, uint:{bits_to_write_symbols_amount}={symbols_amount}, '
+                                  f'uint:6={symbol_bits_amount}')
+
+        ##### Write code table: every symbol followed by its code length.
+        packed_table, bits_amount = pack_fixed_width_fields([self.symbols, self.code_lengths], [symbol_bits_amount, CODE_LENGTH_BITS])
+        self.bitstring.append(BitArray(bytes=packed_table, length=bits_amount))
+
+        ##### Write codes of the sequence. Symbols are found in the sorted alphabet.
+        symbol_indexes = np.searchsorted(self.symbols, self.sequence)
+        packed_codes, bits_amount = pack_variable_width_fields(self.codes[symbol_indexes], self.code_lengths[symbol_indexes])
+        self.bitstring.append(BitArray(bytes=packed_codes, length=bits_amount))
+
+        return self.bitstring
+
+
+
+########## Static Canonical Huffman Decoding Class
+
+class CanonicalHuffmanDecoder():
+
+    def read_bitstream(self, bitstring):
+        self.bitstring = bitstring
+
+
+    def decode(self, symbols_amount):
+        ##### Read alphabet size and symbol width.
+        bits_to_read = self.bitstring.read('uint:5')
+        alphabet_size = self.bitstring.read(f'uint:{bits_to_read}')
+        symbol_bits_amount = self.bitstring.read('uint:6')
+
+        ##### Read code table.
+        table_bits_amount = alphabet_size * (symbol_bits_amount + CODE_LENGTH_BITS)
+        symbols, code_lengths = unpack_fixed_width_fields(self.bitstring.read(table_bits_amount).tobytes(),
+                                                          [symbol_bits_amount, CODE_LENGTH_BITS], alphabet_size)
+        if symbols_amount == 0:
+            return symbols[:0]
+
+        ##### Build the lookup table, indexed by the next 'max_code_length' bits of the bitstring. Each
+        #     entry holds the index of the decoded symbol and the length of its code in the lowest bits.
+        code_lengths = code_lengths.astype(np.int64)
+        codes = compute_canonical_codes(code_lengths)
+        max_code_length = int(code_lengths.max())
+        entries_per_code = np.int64(1) << (max_code_length - code_lengths)
+        lookup_table = np.zeros(1 << max_code_length, dtype=np.int64)
+        first_entries = codes.astype(np.int64) << (max_code_length - code_lengths)
+        entry_values = (np.arange(alphabet_size, dtype=np.int64) << CODE_LENGTH_BITS) | code_lengths
+        lookup_table[np.repeat(first_entries, entries_per_code) + concatenated_ranges(entries_per_code)] = \
+            np.repeat(entry_values, entries_per_code)
+        lookup_table = lookup_table.tolist()
+
+        ##### Decode symbols reading 32 bits at a time, which always hold a whole code.
+        data = self.bitstring[self.bitstring.pos:].tobytes() + bytes(4)
+        shift_base = 32 - max_code_length
+        table_mask = (1 << max_code_length) - 1
+        length_mask = (1 << CODE_LENGTH_BITS) - 1
+        symbol_indexes = [0] * symbols_amount
+        position = 0
+        for index in range(symbols_amount):
+            byte = position >> 3
+            entry = lookup_table[(int.from_bytes(data[byte:byte + 4], 'big') >> (shift_base - (position & 7))) & table_mask]
+            symbol_indexes[index] = entry >> CODE_LENGTH_BITS
+            position += entry & length_mask
+        self.bitstring.pos += position
+
+        return symbols[np.array(symbol_indexes, dtype=np.int64)]
+
+
+
+########## Auxiliary Methods
+
+def compute_code_lengths(counts, code_length_limit):
+    ##### A single symbol still needs one bit.
+    if len(counts) <= 1:
+        return np.ones(len(counts), dtype=np.int64)
+
+    ##### Merge the two least frequent nodes until only the root is left. Parents are
+    #     always created after their children, so depths are computed backwards.
+    heap = [(int(count), node) for node, count in enumerate(counts)]
+    heapq.heapify(heap)
+    parents = [0] * (2 * len(counts) - 1)
+    next_node = len(counts)
+    while len(heap) > 1:
+        first_count, first_node = heapq.heappop(heap)
+        second_count, second_node = heapq.heappop(heap)
+        parents[first_node] = parents[second_node] = next_node
+        heapq.heappush(heap, (first_count + second_count, next_node))
+        next_node += 1
+
+    depths = [0] * next_node
+    for node in range(next_node - 2, -1, -1):
+        depths[node] = depths[parents[node]] + 1
+    code_lengths = np.array(depths[:len(counts)], dtype=np.int64)
+
+    ##### If codes are too long, flatten the frequencies and try again.
+    if code_lengths.max() > code_length_limit:
+        return compute_code_lengths((np.asarray(counts) + 1) // 2, code_length_limit)
+
+    return code_lengths
+
+
+def compute_canonical_codes(code_lengths):
+    ##### Symbols are sorted by code length and then by value, which is their alphabet order.
+    code_lengths = np.asarray(code_lengths, dtype=np.int64)
+    order = np.argsort(code_lengths, kind='stable')
+    sorted_lengths = code_lengths[order]
+
+    ##### The first code of each length follows the last code of the previous length.
+    length_counts = np.bincount(sorted_lengths, minlength=MAX_CODE_LENGTH_LIMIT + 1)
+    first_codes = np.zeros(len(length_counts), dtype=np.int64)
+    for length in range(1, len(length_counts)):
+        first_codes[length] = (first_codes[length - 1] + length_counts[length - 1]) << 1
+
+    ##### Codes of the same length are consecutive.
+    length_starts = np.cumsum(length_counts) - length_counts
+    codes = np.empty(len(code_lengths), dtype=np.int64)
+    codes[order] = first_codes[sorted_lengths] + np.arange(len(code_lengths)) - length_starts[sorted_lengths]
+
+    return codes
+
+
+def concatenated_ranges(lengths):
+    ##### Concatenation of 'range(length)' for every length.
+    return np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
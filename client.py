@@ -0,0 +1,110 @@
+import asyncio
+import itertools
+
+from protocol import pack_frame, read_frame, DEFAULT_HOST, DEFAULT_PORT
+
+
+########## Compression Client Class
+
+# NOTE: The client only depends on the protocol module, so it does not import the coders. Requests can be
+#       sent concurrently over a single connection, and each one waits for the response with its id.
+
+class CompressionClient():
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None):
+        ##### Server address.
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        ##### Requests waiting for their responses, by id.
+        self.pending_requests = {}
+        self.request_ids = itertools.count()
+
+
+    async def connect(self):
+        if self.unix_socket:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.unix_socket)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.receiver = asyncio.create_task(self.__receive_responses())
+        return self
+
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.receiver
+
+
+    async def encode(self, data, **parameters):
+        ##### Returns the binary file content and the response with the request statistics.
+        return await self.request('encode', data, **parameters)
+
+
+    async def decode(self, binary_data, stats=False):
+        return await self.request('decode', binary_data, stats=stats)
+
+
+    async def request(self, operation, body, **parameters):
+        ##### Responses are no longer received once the connection is lost.
+        if self.receiver.done():
+            raise ConnectionError("Connection to the server is closed.")
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending_requests[request_id] = future
+
+        ##### Send request. Writing waits while the server is not reading, which applies its backpressure.
+        self.writer.write(pack_frame({'id': request_id, 'operation': operation, 'parameters': parameters}, bytes(body)))
+        await self.writer.drain()
+
+        response, result = await future
+        assert response['status'] == 'ok', f"Request {request_id} failed: {response['error']}"
+        return result, response
+
+
+    async def __aenter__(self):
+        return await self.connect()
+
+
+    async def __aexit__(self, *exception):
+        await self.close()
+
+
+
+    ########## Private Methods
+
+    async def __receive_responses(self):
+        ##### If the connection is closed or broken, requests still waiting fail instead of waiting forever.
+        error = ConnectionError("Connection closed before the response was received.")
+        try:
+            frame = await read_frame(self.reader)
+            while frame is not None:
+                response, result = frame
+                self.pending_requests.pop(response['id']).set_result((response, result))
+                frame = await read_frame(self.reader)
+        except (asyncio.IncompleteReadError, ConnectionError) as connection_error:
+            error = ConnectionError(f"Connection lost before the response was received: {connection_error}")
+        finally:
+            for future in self.pending_requests.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending_requests.clear()
+
+
+
+########## Auxiliary Methods
+
+# NOTE: Blocking helpers for scripts, with one connection per call.
+
+def encode(data, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None, **parameters):
+    async def request():
+        async with CompressionClient(host, port, unix_socket) as client:
+            return (await client.encode(data, **parameters))[0]
+    return asyncio.run(request())
+
+
+def decode(binary_data, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None):
+    async def request():
+        async with CompressionClient(host, port, unix_socket) as client:
+            return (await client.decode(binary_data))[0]
+    return asyncio.run(request())
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+##### Blocks with nearly uniform bytes and almost no repeated patterns are not worth matching.
+ENTROPY_THRESHOLD = 7.5
+MATCH_RATE_THRESHOLD = 0.05
+PROBE_PATTERN_LENGTH = 4
+##### Blocks are probed on a few windows spread over them, so the probe costs the same for any block size.
+PROBE_WINDOW_SIZE = 1 << 16
+PROBE_WINDOWS_AMOUNT = 4
+##### Hashes of the patterns of a window index a table 64 times larger than it, so their collisions
+#     add less than 1% to the match rate.
+PROBE_HASH_BITS = 22
+PROBE_HASH_MULTIPLIER = 2654435761
+
+
+########## Compressibility Estimation
+
+# NOTE: Both estimates are computed on at most PROBE_WINDOWS_AMOUNT windows of PROBE_WINDOW_SIZE bytes,
+#       taken at even intervals of the block, in much less time than the matching they may save. Repeated
+#       patterns are found within each window by marking their hashes in a table, instead of sorting them.
+#       Blocks that are still not shrunk by the encoding are stored as they are anyway.
+
+def compute_entropy(sequence):
+    ##### First-order entropy of the bytes of the sequence.
+    counts = np.bincount(np.frombuffer(sequence, dtype=np.uint8), minlength=256)
+    probabilities = counts[counts > 0] / max(counts.sum(), 1)
+    return float(-np.sum(probabilities * np.log2(probabilities)))
+
+
+def compute_match_rate(window):
+    ##### Fraction of positions of the window whose next bytes already appeared earlier in it.
+    #     Windows must not be much longer than PROBE_WINDOW_SIZE, or collisions inflate the rate.
+    window = np.frombuffer(window, dtype=np.uint8)
+    patterns_amount = len(window) - PROBE_PATTERN_LENGTH + 1
+    if patterns_amount <= 0:
+        return 0.0
+
+    ##### Patterns are packed in integers, and each distinct one marks a single entry of the table.
+    patterns = np.ascontiguousarray(np.lib.stride_tricks.sliding_window_view(window, PROBE_PATTERN_LENGTH)).view(np.uint32).ravel()
+    hashes = (patterns * np.uint32(PROBE_HASH_MULTIPLIER)) >> np.uint32(32 - PROBE_HASH_BITS)
+    table = np.zeros(1 << PROBE_HASH_BITS, dtype=bool)
+    table[hashes] = True
+
+    return 1 - np.count_nonzero(table) / patterns_amount
+
+
+def take_probe_windows(sequence):
+    ##### Short sequences are split in consecutive windows, and longer ones are sampled at even intervals.
+    sequence = np.frombuffer(sequence, dtype=np.uint8)
+    if len(sequence) <= PROBE_WINDOWS_AMOUNT * PROBE_WINDOW_SIZE:
+        window_starts = range(0, len(sequence), PROBE_WINDOW_SIZE)
+    else:
+        window_starts = np.linspace(0, len(sequence) - PROBE_WINDOW_SIZE, PROBE_WINDOWS_AMOUNT).astype(np.int64).tolist()
+
+    return [sequence[window_start:window_start + PROBE_WINDOW_SIZE] for window_start in window_starts]
+
+
+def is_incompressible(sequence):
+    windows = take_probe_windows(sequence)
+    if not windows or compute_entropy(np.concatenate(windows)) < ENTROPY_THRESHOLD:
+        return False
+
+    ##### Match rate of all windows, weighted by their amount of patterns.
+    patterns_amounts = [max(len(window) - PROBE_PATTERN_LENGTH + 1, 0) for window in windows]
+    matches_amount = sum(compute_match_rate(window) * patterns_amount for window, patterns_amount in zip(windows, patterns_amounts))
+    return matches_amount <= MATCH_RATE_THRESHOLD * max(sum(patterns_amounts), 1)
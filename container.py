@@ -0,0 +1,162 @@
+import mmap
+import struct
+
+from bitstring import ConstBitStream
+
+
+########## Binary File Format
+
+MAGIC_NUMBER = b'LZ77'
+FORMAT_VERSION = 6
+
+##### File types. Raw files are any other file, encoded as they are.
+TEXT_FILE = 0
+IMAGE_FILE = 1
+RAW_FILE = 2
+
+##### Header flags. Independent blocks do not use the previous ones as initial search buffer.
+#     Planar images have their channels encoded one after another. Token payloads are byte-aligned tokens.
+#     Stored payloads are the encoded sequence itself, written when it could not be compressed.
+BLOCKED_PAYLOAD = 1
+INDEPENDENT_BLOCKS = 2
+PLANAR_CHANNELS = 4
+TOKEN_FORMAT = 8
+STORED_PAYLOAD = 16
+
+# NOTE: The header is made of the magic number, the format version and the fields below, in this order.
+#       Text and raw files have null image filter, channels, height and width. Only raw files have their extension
+#       saved, in a null-padded field. The checksum is the CRC-32 of the encoded sequence, which is the original
+#       file content unless an image filter is used. Files encoded with a preset dictionary have its identifier,
+#       which is null otherwise.
+#       Blocked payloads are written while encoding, so their checksum and amount of bits are null in the header.
+HEADER_FIELDS = ['file_type', 'flags', 'image_filter', 'channels', 'height', 'width', 'extension', 'search_buffer_size',
+                 'look_ahead_buffer_size', 'dictionary_id', 'checksum', 'payload_bits']
+HEADER_FORMAT = '>4sBBBBBII8sIIIIQ'
+EXTENSION_SIZE = 8
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+##### Block types. Stored blocks hold their decoded bytes as they are.
+END_BLOCK = 0
+LZ77_BLOCK = 1
+STORED_BLOCK = 2
+
+# NOTE: Each block of a blocked payload starts with its type, its amount of decoded bytes and its amount
+#       of bits. Blocks are padded to a whole amount of bytes. After the end block, the checksum is written,
+#       followed by the block index: the decoded offset, file offset, file size and decoded size of each
+#       block. The file ends with the index magic number and the amount of blocks, so the index can be
+#       found from the end of the file.
+BLOCK_HEADER_FORMAT = '>BIQ'
+BLOCK_HEADER_SIZE = struct.calcsize(BLOCK_HEADER_FORMAT)
+CHECKSUM_FORMAT = '>I'
+CHECKSUM_SIZE = struct.calcsize(CHECKSUM_FORMAT)
+INDEX_MAGIC_NUMBER = b'LZIX'
+INDEX_ENTRY_FORMAT = '>QQQI'
+INDEX_ENTRY_SIZE = struct.calcsize(INDEX_ENTRY_FORMAT)
+INDEX_TRAILER_FORMAT = '>4sI'
+INDEX_TRAILER_SIZE = struct.calcsize(INDEX_TRAILER_FORMAT)
+
+
+def write_container(binary_file_path, header, payload):
+    with open(binary_file_path, "wb") as bin_file:
+        bin_file.write(pack_container(header, payload))
+        bin_file.close()
+
+
+def pack_container(header, payload):
+    ##### Include the exact amount of payload bits, since the last byte may be padded.
+    header = dict(header, flags=header.get('flags', 0) & ~(BLOCKED_PAYLOAD | INDEPENDENT_BLOCKS), payload_bits=len(payload))
+    return struct.pack(HEADER_FORMAT, MAGIC_NUMBER, FORMAT_VERSION, *[header[field] for field in HEADER_FIELDS]) + payload.tobytes()
+
+
+# NOTE: The following functions write to any binary stream and return the amount of written bytes.
+
+def write_container_header(stream, header):
+    return stream.write(struct.pack(HEADER_FORMAT, MAGIC_NUMBER, FORMAT_VERSION, *[header[field] for field in HEADER_FIELDS]))
+
+
+def write_block(stream, block_type, decoded_bytes_amount, payload):
+    return (stream.write(struct.pack(BLOCK_HEADER_FORMAT, block_type, decoded_bytes_amount, len(payload))) +
+            stream.write(payload.tobytes()))
+
+
+def write_blocks_end(stream, checksum, block_index):
+    written_bytes = stream.write(struct.pack(BLOCK_HEADER_FORMAT, END_BLOCK, 0, 0))
+    written_bytes += stream.write(struct.pack(CHECKSUM_FORMAT, checksum))
+
+    ##### Write block index.
+    for index_entry in block_index:
+        written_bytes += stream.write(struct.pack(INDEX_ENTRY_FORMAT, *index_entry))
+    written_bytes += stream.write(struct.pack(INDEX_TRAILER_FORMAT, INDEX_MAGIC_NUMBER, len(block_index)))
+
+    return written_bytes
+
+
+def read_container(binary_file_path):
+    ##### Only the header is parsed. The file is mapped, so its content is never fully read.
+    with open(binary_file_path, "rb") as bin_file:
+        with mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            header = unpack_container_header(mapped_file)
+
+    ##### The payload is a bitstream backed by a memory map of the file. Blocked payloads go until the end of the file.
+    payload_bits = None if header['flags'] & BLOCKED_PAYLOAD else header['payload_bits']
+    payload = ConstBitStream(filename=binary_file_path, offset=HEADER_SIZE * 8, length=payload_bits)
+
+    return header, payload
+
+
+def unpack_container(binary_data):
+    ##### Containers held in memory are only supported with a single payload, since blocks are read from files.
+    header = unpack_container_header(binary_data)
+    assert not header['flags'] & BLOCKED_PAYLOAD, "Blocked payloads can only be read from files."
+    payload = ConstBitStream(bytes=binary_data, offset=HEADER_SIZE * 8, length=header['payload_bits'])
+
+    return header, payload
+
+
+def unpack_container_header(buffer):
+    assert len(buffer) >= HEADER_SIZE, "File is too short to be an LZ77 binary file."
+    magic_number, version, *fields = struct.unpack_from(HEADER_FORMAT, buffer)
+
+    ##### Verify file format.
+    assert magic_number == MAGIC_NUMBER, "File is not an LZ77 binary file."
+    assert version == FORMAT_VERSION, f"Binary file format version {version} is not supported."
+
+    return dict(zip(HEADER_FIELDS, fields))
+
+
+def read_block_index(binary_file_path):
+    ##### The index is read backwards from the end of the mapped file.
+    with open(binary_file_path, "rb") as bin_file:
+        with mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            index_end = len(mapped_file) - INDEX_TRAILER_SIZE
+            magic_number, blocks_amount = struct.unpack_from(INDEX_TRAILER_FORMAT, mapped_file, index_end)
+            assert magic_number == INDEX_MAGIC_NUMBER, "Binary file does not end with a block index."
+
+            ##### Each entry has the decoded offset, file offset, file size and decoded size of a block.
+            index_start = index_end - blocks_amount * INDEX_ENTRY_SIZE
+            block_index = list(struct.iter_unpack(INDEX_ENTRY_FORMAT, mapped_file[index_start:index_end]))
+
+            ##### The checksum precedes the index.
+            checksum, = struct.unpack_from(CHECKSUM_FORMAT, mapped_file, index_start - CHECKSUM_SIZE)
+
+    return block_index, checksum
+
+
+def read_block_at(binary_file_path, block_file_offset):
+    ##### Map a single block, given its offset in the file.
+    payload = ConstBitStream(filename=binary_file_path, offset=block_file_offset * 8)
+    return read_block(payload)
+
+
+def read_block(payload):
+    ##### Read block header. For the end block, the payload checksum is returned instead of the block bitstring.
+    block_type, decoded_bytes_amount, bits_amount = struct.unpack(BLOCK_HEADER_FORMAT, payload.read(f'bytes:{BLOCK_HEADER_SIZE}'))
+    if block_type == END_BLOCK:
+        checksum, = struct.unpack(CHECKSUM_FORMAT, payload.read('bytes:4'))
+        return block_type, decoded_bytes_amount, checksum
+
+    ##### Read block bitstring and skip its padding.
+    block_bitstring = payload.read(bits_amount)
+    payload.bytealign()
+
+    return block_type, decoded_bytes_amount, block_bitstring
@@ -1,96 +1,166 @@
 import os
 import sys
+import zlib
 import argparse
 import numpy as np
 
-from PIL import Image
 from pathlib import Path
-from decimal import getcontext
-from bitstring import BitStream, ReadError
+from bisect import bisect_right
 
-from LZ77 import LZ77
+from LZ77 import LZ77, CHUNK_SIZE
+from instrumentation import CodingStats, measure
+from image_filters import unfilter_image
+from dictionary import get_dictionary_id, read_dictionary
+from container import (read_container, unpack_container, read_block_index, read_block_at,
+                       TEXT_FILE, IMAGE_FILE, BLOCKED_PAYLOAD, INDEPENDENT_BLOCKS, PLANAR_CHANNELS, TOKEN_FORMAT, STORED_PAYLOAD,
+                       LZ77_BLOCK, STORED_BLOCK)
 
-# Import Adaptative Huffman Encoder
-sys.path.insert(1, "../Adaptative_Huffman_Coding")
-from huffman_decoder import HuffmanDecoder
+# NOTE: PIL, the Huffman decoders and the process pools are only imported by the code that uses them,
+#       so decoding a text or raw file without a second encoding step does not wait for them to load.
 
 
 ########## LZ77 Decoding Class
 
 class Decoder():
 
-    def __init__(self, binary_file):
-        ##### Read bitstring from file.
-        with open(binary_file) as bin_file:
-            binary = bin_file.read()
-            self.bitstring = BitStream(f'0b{binary}')
-
-
-    def decode_bitstring(self):
+    def __init__(self, binary_file, stats=None, binary_data=None, dictionary=None):
+        ##### Read file header and map bitstring from file. Binary data given instead of a file is read from memory.
+        self.binary_file_path = binary_file
+        self.header, self.bitstring = read_container(binary_file) if binary_data is None else unpack_container(binary_data)
+        ##### Files encoded with a preset dictionary require the same one. Only its end fits in the search buffer.
+        dictionary_id = self.header['dictionary_id']
+        assert dictionary or not dictionary_id, f"Binary file was encoded with preset dictionary {dictionary_id:08x}, which must be given."
+        assert not dictionary or dictionary_id == get_dictionary_id(dictionary), \
+            f"Preset dictionary {get_dictionary_id(dictionary):08x} is not the one of the binary file ({dictionary_id:08x})."
+        self.dictionary_history = bytes(dictionary[-self.header['search_buffer_size']:]) if dictionary else b''
+        ##### Optional statistics of the decoding process.
+        self.stats = stats
+        self.block_decoder = BlockDecoder(stats, bool(self.header['flags'] & TOKEN_FORMAT))
+
+        ##### Blocked payloads are indexed at the end of the file.
+        if self.header['flags'] & BLOCKED_PAYLOAD:
+            self.block_index, self.blocks_checksum = read_block_index(binary_file)
+
+
+    def decode_bitstring(self, workers=1):
         ##### Decode encoder header
         self.__decode_header()
 
-        ##### Instantiate LZ77
-        LZ77_decoder = LZ77()
+        ##### Blocked payloads are decoded one block at a time.
+        if self.header['flags'] & BLOCKED_PAYLOAD:
+            self.sequence = b''.join(self.__decode_blocks(0, len(self.block_index), workers))
+            checksum = self.blocks_checksum
+        ##### Otherwise, the whole payload is a single block. Workers are used for its entropy coding streams.
+        else:
+            block_type = STORED_BLOCK if self.header['flags'] & STORED_PAYLOAD else LZ77_BLOCK
+            self.sequence = self.block_decoder.decode_block(self.bitstring, self.dictionary_history, workers, block_type)
+            checksum = self.header['checksum']
 
-        ##### Verify if second encoding step was performed.
-        second_coding_bit = self.bitstring.read('bin:1')
+        ##### Verify decoded content.
+        with measure(self.stats, 'checksum'):
+            assert zlib.crc32(self.sequence) == checksum, "Decoded sequence does not match the file checksum."
 
-        ##### Decode with AE.
-        if second_coding_bit is '1':
-            ##### Get triples amount
-            triples_bits_amount = self.bitstring.read('uint:5')
-            self.triples_amount = self.bitstring.read(f'uint:{triples_bits_amount}')
+        return
 
-            ##### Decode offsets and lengths with Adaptative binary tree.
-            offsets = self.__decode_with_HC()
-            match_lengths = self.__decode_with_HC()
-            codes = self.__decode_with_HC()
-            
-            ##### Merge info and create triples
-            triples = np.column_stack((offsets, match_lengths, codes))
 
-            ##### Provide triples to LZ77 decoder.
-            LZ77_decoder.read_triples(triples)
-            self.sequence = LZ77_decoder.decode_sequence_from_triples()
+    def decode_range(self, start, end, workers=1):
+        ##### Without blocks, the whole payload must be decoded.
+        if not self.header['flags'] & BLOCKED_PAYLOAD:
+            self.decode_bitstring()
+            return bytes(self.sequence[start:end])
 
-        ##### Decode with LZ77
+        ##### Find the blocks covering the range from their decoded offsets.
+        decoded_offsets = [index_entry[0] for index_entry in self.block_index]
+        first_block = max(bisect_right(decoded_offsets, start) - 1, 0)
+        last_block = max(bisect_right(decoded_offsets, max(end - 1, start)) - 1, 0)
+
+        ##### Decode blocks and cut the range.
+        decoded_range = b''.join(self.__decode_blocks(first_block, last_block + 1, workers))
+        range_start = start - decoded_offsets[first_block]
+        return decoded_range[range_start:range_start + max(end - start, 0)]
+
+
+    def iter_decoded_chunks(self, chunk_size=CHUNK_SIZE):
+        # NOTE: Decoded chunks are yielded as soon as they are complete, and only the last search buffer
+        #       of decoded bytes is kept. The checksum is verified after the last chunk.
+        self.__decode_header()
+        history_size = self.header['search_buffer_size']
+        checksum = decoded_bytes_amount = 0
+
+        ##### Without blocks, the whole payload is a single block.
+        if not self.header['flags'] & BLOCKED_PAYLOAD:
+            block_type = STORED_BLOCK if self.header['flags'] & STORED_PAYLOAD else LZ77_BLOCK
+            for chunk in self.block_decoder.iter_decoded_block(self.bitstring, self.dictionary_history, history_size, chunk_size,
+                                                               block_type):
+                checksum = zlib.crc32(chunk, checksum)
+                yield chunk
+            assert checksum == self.header['checksum'], "Decoded sequence does not match the file checksum."
+            return
+
+        ##### Otherwise, blocks are decoded in order. Primed blocks receive the end of the previous ones as history,
+        #     after the preset dictionary.
+        history = bytearray(self.dictionary_history)
+        for _, block_file_offset, _, block_decoded_bytes_amount in self.block_index:
+            block_type, _, bitstring = read_block_at(self.binary_file_path, block_file_offset)
+            block_history = self.dictionary_history if self.header['flags'] & INDEPENDENT_BLOCKS else bytes(history)
+            for chunk in self.block_decoder.iter_decoded_block(bitstring, block_history, history_size, chunk_size, block_type):
+                history += chunk
+                del history[:max(len(history) - history_size, 0)]
+                checksum = zlib.crc32(chunk, checksum)
+                decoded_bytes_amount += len(chunk)
+                yield chunk
+            assert decoded_bytes_amount == block_decoded_bytes_amount, "Decoded block does not have the expected length."
+            decoded_bytes_amount = 0
+
+        assert checksum == self.blocks_checksum, "Decoded sequence does not match the file checksum."
+
+
+    def stream_decoded_file(self, decoded_file_path, chunk_size=CHUNK_SIZE):
+        ##### Images are reconstructed from the whole filtered sequence, so only text and raw files are streamed.
+        assert self.header['file_type'] != IMAGE_FILE, "Images can not be decoded as a stream."
+
+        ##### Chunks are written as soon as they are decoded. '-' writes to the standard output.
+        if decoded_file_path == '-':
+            decoded_file = sys.stdout.buffer
         else:
-            self.sequence = LZ77_decoder.decode_sequence_from_bitstring(self.bitstring)
+            decoded_file_path += '.txt' if self.header['file_type'] == TEXT_FILE else self.header['extension'].rstrip(b'\0').decode()
+            decoded_file = open(decoded_file_path, "wb")
 
-        return
+        for chunk in self.iter_decoded_chunks(chunk_size):
+            with measure(self.stats, 'file_writing'):
+                decoded_file.write(chunk)
+
+        decoded_file.flush()
+        if decoded_file_path != '-':
+            decoded_file.close()
 
 
     def save_decoded_file(self, decoded_file_path):
-        ##### For text files, the bytes will be transformed into chars.
-        if self.text_file:
-            text = ''.join([chr(byte) for byte in self.sequence])
-            ##### Save text in destiny path.
-            decoded_file_path += '.txt'
-            with open(decoded_file_path, "w") as decoded_file:
-                decoded_file.write(text)
+        ##### For text and raw files, the decoded bytes are written as they are, with the original extension.
+        if self.file_type != IMAGE_FILE:
+            ##### Save file in destiny path.
+            decoded_file_path += '.txt' if self.file_type == TEXT_FILE else self.extension
+            with open(decoded_file_path, "wb") as decoded_file:
+                decoded_file.write(self.sequence)
                 decoded_file.close()
         
-        ##### For images, the dimensions should be first obtained.
+        ##### For images, the dimensions are read from the header.
         else:
-            bytes_amount = len(self.sequence)
-            second_degree_coeff = [1, np.abs(self.width_height_diff), -bytes_amount]
-            height = int(np.around(np.roots(second_degree_coeff).max(), 0))
-            width = height + self.width_height_diff
+            height, width, channels = self.height, self.width, self.channels
             # Define dimensions
             self.image_dimensions = [height, width]
-            self.image_dimensions.append(3) if self.three_channel_image else None
-            ##### Reshape Image
-            channels = 3 if self.three_channel_image else 1
-            img = np.squeeze(np.array(self.sequence, dtype=np.uint8).reshape((height, width, channels)))
+            self.image_dimensions.append(channels) if channels > 1 else None
+            ##### Reconstruct image from the residuals of the image filter.
+            img = np.squeeze(unfilter_image(self.sequence, height, width, channels, self.image_filter, self.planar))
             ##### Include image extension
-            if self.three_channel_image:
+            if channels > 1:
                 decoded_file_path += '.png' 
                 file_format = 'PNG'
             else:
                 decoded_file_path += '.bmp'
                 file_format = 'BMP' 
             ##### Save image
+            from PIL import Image
             image = Image.fromarray(img)
             image.save(decoded_file_path, format=file_format)
 
@@ -100,40 +170,192 @@ class Decoder():
     ##### Private Methods
 
     def __decode_header(self):
-        ##### Verify if file is an image or text
-        file_type = self.bitstring.read('bin:1')
-        self.text_file = True if file_type == '0' else False
+        ##### Verify if file is text, image or any other file.
+        self.file_type = self.header['file_type']
+        self.extension = self.header['extension'].rstrip(b'\0').decode()
 
         ##### Get dimensions for image file
-        if self.text_file is False:
-            # Verify number of channels
-            channels_amount = self.bitstring.read('bin:1')
-            self.three_channel_image = True if channels_amount == '1' else False
-            # Obtain width and height difference
-            self.width_height_diff = self.bitstring.read('int:14')
+        if self.file_type == IMAGE_FILE:
+            self.channels = self.header['channels']
+            self.height = self.header['height']
+            self.width = self.header['width']
+            self.image_filter = self.header['image_filter']
+            self.planar = bool(self.header['flags'] & PLANAR_CHANNELS)
 
         return
 
 
-    def __decode_with_HC(self):
+    def __decode_blocks(self, first_block, end_block, workers):
+        block_file_offsets = [index_entry[1] for index_entry in self.block_index[first_block:end_block]]
+
+        ##### Independent blocks can be decoded on their own, and concurrently. Each one is preceded by the preset dictionary.
+        if self.header['flags'] & INDEPENDENT_BLOCKS:
+            if workers == 1:
+                decoded_blocks = [self.block_decoder.decode_file_block(self.binary_file_path, block_file_offset, self.dictionary_history)
+                                  for block_file_offset in block_file_offsets]
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    decoded_blocks = list(executor.map(self.block_decoder.decode_file_block,
+                                                       [self.binary_file_path] * len(block_file_offsets), block_file_offsets,
+                                                       [self.dictionary_history] * len(block_file_offsets)))
+            return decoded_blocks
+
+        ##### Otherwise, the end of the already decoded sequence is the search buffer of each block,
+        #     so every block since the first one is decoded in order.
+        decoded_blocks = []
+        history = self.dictionary_history
+        search_buffer_size = self.header['search_buffer_size']
+        for block_number, index_entry in enumerate(self.block_index[:end_block]):
+            decoded_block = self.block_decoder.decode_file_block(self.binary_file_path, index_entry[1], history)
+            history = (history + bytes(decoded_block[-search_buffer_size:]))[-search_buffer_size:]
+            if block_number >= first_block:
+                decoded_blocks.append(decoded_block)
+
+        return decoded_blocks
+
+
+
+########## LZ77 Block Decoding Class
+
+# NOTE: Block decoders hold no file content, so they can be sent to worker processes.
+
+class BlockDecoder():
+
+    def __init__(self, stats=None, token_format=False):
+        ##### Optional statistics of the decoding process.
+        self.stats = stats
+        ##### Blocks are either byte-aligned tokens or triples packed in bits.
+        self.token_format = token_format
+
+
+    def __getstate__(self):
+        ##### Statistics are kept in this process. Blocks decoded by workers are not measured.
+        return dict(self.__dict__, stats=None)
+
+
+    def decode_file_block(self, binary_file_path, block_file_offset, history=b''):
+        ##### Read the block starting at the given offset of the binary file.
+        block_type, decoded_bytes_amount, bitstring = read_block_at(binary_file_path, block_file_offset)
+        assert block_type in [LZ77_BLOCK, STORED_BLOCK], "Block index does not point to an LZ77 or stored block."
+
+        decoded_block = self.decode_block(bitstring, history, block_type=block_type)
+        assert len(decoded_block) == decoded_bytes_amount, "Decoded block does not have the expected length."
+
+        return decoded_block
+
+
+    def decode_block(self, bitstring, history=b'', workers=1, block_type=LZ77_BLOCK):
+        ##### Stored blocks are copied through.
+        if block_type == STORED_BLOCK:
+            with measure(self.stats, 'stored_copy'):
+                decoded_block = bitstring.tobytes()
+            if self.stats is not None:
+                self.stats.count('stored_blocks')
+                self.stats.count('stored_bytes', len(decoded_block))
+            return decoded_block
+
+        ##### Instantiate LZ77. Symbols preceding the block are used as initial search buffer.
+        LZ77_decoder = LZ77(self.stats)
+        LZ77_decoder.prime_search_buffer(history)
+
+        ##### Tokens are expanded straight from the bytes of the bitstring.
+        if self.token_format:
+            return LZ77_decoder.decode_sequence_from_tokens(bitstring.tobytes())
+
+        ##### Verify if second encoding step was performed. In this case, triples are decoded with HC.
+        if bitstring.read('bin:1') == '1':
+            LZ77_decoder.read_triples(self.__decode_HC_triples(bitstring, workers))
+            return LZ77_decoder.decode_sequence_from_triples()
+
+        ##### Decode with LZ77
+        else:
+            return LZ77_decoder.decode_sequence_from_bitstring(bitstring)
+
+
+    def iter_decoded_block(self, bitstring, history=b'', history_size=0, chunk_size=CHUNK_SIZE, block_type=LZ77_BLOCK):
+        ##### Stored blocks are copied through, one chunk at a time.
+        if block_type == STORED_BLOCK:
+            while bitstring.pos < len(bitstring):
+                yield bitstring.read(min(8 * chunk_size, len(bitstring) - bitstring.pos)).tobytes()
+            return
+
+        ##### Otherwise, the block is decoded as in 'decode_block', but yielded in chunks.
+        LZ77_decoder = LZ77(self.stats)
+        LZ77_decoder.prime_search_buffer(history)
+        history_size = max(history_size, len(history))
+
+        if self.token_format:
+            yield from LZ77_decoder.iter_sequence_from_tokens(bitstring.tobytes(), history_size, chunk_size)
+        elif bitstring.read('bin:1') == '1':
+            LZ77_decoder.read_triples(self.__decode_HC_triples(bitstring))
+            yield from LZ77_decoder.iter_sequence_from_triples(history_size, chunk_size)
+        else:
+            yield from LZ77_decoder.iter_sequence_from_bitstring(bitstring, history_size, chunk_size)
+
+
+    ##### Private Methods
+
+    def __decode_HC_triples(self, bitstring, workers=1):
+        ##### Verify which entropy coder was used.
+        self.canonical_coding = bitstring.read('bin:1') == '1'
+
+        ##### Get triples amount
+        triples_bits_amount = bitstring.read('uint:5')
+        self.triples_amount = bitstring.read(f'uint:{triples_bits_amount}')
+
+        ##### Split the offsets, lengths and codes streams. Their lengths are written
+        #     before each one, so they can be decoded at once.
+        stream_bitstrings = [self.__read_HC_bitstring(bitstring) for _ in range(3)]
+        stream_arguments = [stream_bitstrings, [self.canonical_coding] * 3, [self.triples_amount] * 3]
+
+        ##### Decode streams. With more than one worker, they are decoded concurrently.
+        with measure(self.stats, 'entropy_decoding'):
+            if workers == 1:
+                offsets, match_lengths, codes = map(decode_HC_bitstring, *stream_arguments)
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=min(workers, 3)) as executor:
+                    offsets, match_lengths, codes = executor.map(decode_HC_bitstring, *stream_arguments)
+
+        ##### Merge info and create triples
+        return np.column_stack((offsets, match_lengths, codes))
+
+
+    def __read_HC_bitstring(self, main_bitstring):
         ##### Get amount of bits in bitstring.
-        bits_to_read = self.bitstring.read('uint:5')
-        bits_amount = self.bitstring.read(f'uint:{bits_to_read}')
+        bits_to_read = main_bitstring.read('uint:5')
+        bits_amount = main_bitstring.read(f'uint:{bits_to_read}')
 
         ##### Read bitstring
-        bitstring = self.bitstring.read(f'bin:{bits_amount}')
+        return main_bitstring.read(bits_amount)
+
+
+
+########## Auxiliary Methods
+
+# NOTE: Stream bitstrings are decoded by module functions, so they can be sent to worker processes.
 
-        ##### Decode bitstring
-        huffman_decoder = HuffmanDecoder(symbols_amount=self.triples_amount)
+def decode_HC_bitstring(bitstring, canonical_coding, symbols_amount):
+    ##### Static canonical codes are decoded straight from the bitstream.
+    if canonical_coding:
+        from canonical_huffman import CanonicalHuffmanDecoder
+        huffman_decoder = CanonicalHuffmanDecoder()
         huffman_decoder.read_bitstream(bitstring)
-        huffman_decoder.decode_with_adaptative_hc(verbose=False)
-        decoded_bytes = huffman_decoder.get_decoded_bytes()
+        return huffman_decoder.decode(symbols_amount)
 
-        return decoded_bytes
+    ##### Import Adaptative Huffman Decoder. It is only required by this entropy coder.
+    sys.path.insert(1, "../Adaptative_Huffman_Coding")
+    from huffman_decoder import HuffmanDecoder
 
+    ##### Decode bitstring
+    huffman_decoder = HuffmanDecoder(symbols_amount=symbols_amount)
+    huffman_decoder.read_bitstream(bitstring.bin)
+    huffman_decoder.decode_with_adaptative_hc(verbose=False)
+    decoded_bytes = huffman_decoder.get_decoded_bytes()
 
+    return decoded_bytes
 
-########## Auxiliary Methods
 
 def menage_decoded_file_path(args):
     ##### Define directory path.
@@ -149,22 +371,47 @@ def menage_decoded_file_path(args):
         directory.mkdir(parents=True)
 
 
-
-if __name__ == "__main__":
+def create_parser(prog=None):
     ##### Receives binary to be decoded from command line.
-    parser = argparse.ArgumentParser(description="Receives binary file and path to save reconstructed file.")
-    
+    parser = argparse.ArgumentParser(prog=prog, description="Receives binary file and path to save reconstructed file.")
+
     parser.add_argument('--binary_file_path', required=True, help='Path to binary file.')
     parser.add_argument('--decoded_file_path', required=False, help="Path to save decoded file. "
                                                    "If folders do not exist, they'll be created.")
+    parser.add_argument('--workers', default=1, type=int, help='Amount of processes decoding independent blocks concurrently. '
+                                                                 'Without blocks, the second encoding step streams are decoded concurrently.')
+    parser.add_argument('--stats', help='Path to save decoding statistics as JSON.')
+    parser.add_argument('--stream', action='store_true', help='Flag to write the decoded file while decoding, keeping only the search buffer in memory. '
+                                                              "In this mode, '-' as decoded file path writes to the standard output.")
+    parser.add_argument('--chunk_size', default=CHUNK_SIZE, type=int, help='Amount of decoded bytes written at once in stream mode.')
+    parser.add_argument('--dictionary', help='Path to the preset dictionary used by the encoder, if any.')
 
-    ##### Read command line
-    args = parser.parse_args(sys.argv[1:])
-    
+    return parser
+
+
+def main(args):
     ##### Menage decoded file path
-    menage_decoded_file_path(args)
+    if args.decoded_file_path != '-':
+        menage_decoded_file_path(args)
+
+    ##### Statistics are only collected if they are saved.
+    stats = CodingStats() if args.stats else None
 
     ##### Decode binary
-    decoder = Decoder(args.binary_file_path)
-    decoder.decode_bitstring()
-    decoder.save_decoded_file(args.decoded_file_path)
\ No newline at end of file
+    dictionary = read_dictionary(args.dictionary) if args.dictionary else None
+    decoder = Decoder(args.binary_file_path, stats, dictionary=dictionary)
+    if args.stream:
+        decoder.stream_decoded_file(args.decoded_file_path, args.chunk_size)
+    else:
+        decoder.decode_bitstring(args.workers)
+        decoder.save_decoded_file(args.decoded_file_path)
+
+    ##### Save statistics
+    if stats is not None:
+        stats.dump(args.stats)
+
+
+
+if __name__ == "__main__":
+    ##### Read command line
+    main(create_parser().parse_args(sys.argv[1:]))
@@ -0,0 +1,150 @@
+import os
+import sys
+import zlib
+import heapq
+import argparse
+import numpy as np
+
+
+##### Default amount of bytes of trained dictionaries, and of the segments they are made of.
+DICTIONARY_SIZE = 4095
+SEGMENT_SIZE = 64
+##### Patterns are packed in 64-bit integers, so they have 8 bytes.
+PATTERN_LENGTH = 8
+
+
+########## Preset Dictionaries
+
+# NOTE: A preset dictionary is a sequence of bytes known by both encoder and decoder, which primes the search
+#       buffer before the first symbol is encoded. Only its last search buffer of bytes can be referred to,
+#       so the most useful content is placed at its end. Dictionaries are plain files, identified in the
+#       binary file header by the CRC-32 of their content.
+
+def get_dictionary_id(dictionary):
+    ##### Null identifiers mean no dictionary, so they are never used.
+    return zlib.crc32(dictionary) or 1
+
+
+def read_dictionary(dictionary_path):
+    with open(dictionary_path, "rb") as dictionary_file:
+        return dictionary_file.read()
+
+
+def read_samples(sample_paths, split_lines=False):
+    ##### Directories are read recursively. With 'split_lines', each line of the files is a sample.
+    samples = []
+    for sample_path in sample_paths:
+        file_paths = [sample_path]
+        if os.path.isdir(sample_path):
+            file_paths = sorted(os.path.join(directory, file_name) for directory, _, file_names in os.walk(sample_path)
+                                for file_name in file_names)
+        for file_path in file_paths:
+            with open(file_path, "rb") as sample_file:
+                content = sample_file.read()
+            samples.extend(content.splitlines(keepends=True) if split_lines else [content])
+
+    return samples
+
+
+
+########## Dictionary Training
+
+# NOTE: Samples are split in segments, and each segment is scored by the amount of samples containing each
+#       of its distinct patterns. The best segment is taken and its patterns stop counting, so the next ones
+#       bring new content. Scores only decrease, so a segment whose updated score is still the best one is
+#       taken without scoring the others again.
+
+def train_dictionary(samples, dictionary_size=DICTIONARY_SIZE, segment_size=SEGMENT_SIZE):
+    assert segment_size > PATTERN_LENGTH, f"Segments must be longer than {PATTERN_LENGTH} bytes."
+
+    ##### Patterns of all samples, as indices of the distinct ones, with the sample and position they start at.
+    sample_patterns = [get_patterns(np.frombuffer(sample, dtype=np.uint8)) for sample in samples]
+    distinct_patterns, patterns_indices = np.unique(np.concatenate(sample_patterns + [np.empty(0, dtype=np.uint64)]),
+                                                    return_inverse=True)
+    patterns_amount = len(distinct_patterns)
+    assert patterns_amount, f"Samples must have at least {PATTERN_LENGTH} bytes."
+    sample_ids = np.repeat(np.arange(len(samples), dtype=np.int64), [len(patterns) for patterns in sample_patterns])
+    positions = np.arange(len(patterns_indices)) - np.cumsum([0] + [len(patterns) for patterns in sample_patterns])[sample_ids]
+
+    ##### Amount of samples containing each pattern. Pairs of sample and pattern are packed in integers, so they are counted once.
+    sample_pairs = get_distinct_values(sample_ids * patterns_amount + patterns_indices)
+    sample_counts = np.bincount(sample_pairs % patterns_amount, minlength=patterns_amount)
+
+    ##### Split samples in segments. Each segment has the distinct patterns entirely inside it.
+    segment_offsets = np.cumsum([0] + [-(-len(sample) // segment_size) for sample in samples])
+    inside_segment = positions % segment_size <= segment_size - PATTERN_LENGTH
+    segment_ids = segment_offsets[sample_ids] + positions // segment_size
+    segment_pairs = get_distinct_values(segment_ids[inside_segment] * patterns_amount + patterns_indices[inside_segment])
+    segment_bounds = np.searchsorted(segment_pairs // patterns_amount, np.arange(segment_offsets[-1] + 1))
+    segments_patterns = segment_pairs % patterns_amount
+    scores = np.add.reduceat(np.append(sample_counts[segments_patterns], 0), segment_bounds[:-1])
+    scores[segment_bounds[:-1] == segment_bounds[1:]] = 0
+
+    ##### Take segments from the best one, until the dictionary is full or no segment adds any pattern.
+    heap = [(-score, segment) for segment, score in enumerate(scores.tolist()) if score]
+    heapq.heapify(heap)
+    taken_segments, taken_bytes = [], 0
+    while heap and taken_bytes < dictionary_size:
+        _, segment = heapq.heappop(heap)
+        patterns = segments_patterns[segment_bounds[segment]:segment_bounds[segment + 1]]
+        score = int(sample_counts[patterns].sum())
+        if score == 0:
+            continue
+        ##### Segments that are no longer the best one go back with their updated score.
+        if heap and score < -heap[0][0]:
+            heapq.heappush(heap, (-score, segment))
+            continue
+        sample_counts[patterns] = 0
+        sample = np.searchsorted(segment_offsets, segment, side='right') - 1
+        segment_start = (segment - segment_offsets[sample]) * segment_size
+        taken_segments.append(samples[sample][segment_start:segment_start + segment_size])
+        taken_bytes += len(taken_segments[-1])
+
+    ##### The best segments are placed at the end, closer to the encoded sequence.
+    return b''.join(reversed(taken_segments))[-dictionary_size:]
+
+
+def get_patterns(sequence):
+    ##### Patterns starting at each position, packed in integers.
+    if len(sequence) < PATTERN_LENGTH:
+        return np.empty(0, dtype=np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(sequence, PATTERN_LENGTH)
+    return np.ascontiguousarray(windows).view(np.uint64).ravel()
+
+
+def get_distinct_values(values):
+    ##### Sorted distinct values. Sorting and dropping repetitions is faster than 'np.unique' for large integer arrays.
+    values = np.sort(values)
+    return values[np.append(True, values[1:] != values[:-1])]
+
+
+def create_parser(prog=None):
+    ##### Receives samples and dictionary path from command line.
+    parser = argparse.ArgumentParser(prog=prog, description="Trains a preset dictionary from sample files.")
+
+    parser.add_argument('--samples', required=True, nargs='+', help='Paths to sample files, or to directories with them.')
+    parser.add_argument('--dictionary_path', required=True, help='Path to save the dictionary.')
+    parser.add_argument('--dictionary_size', default=DICTIONARY_SIZE, type=int, help='Amount of bytes of the dictionary. '
+                                                                                     'Only the last search buffer of bytes is used.')
+    parser.add_argument('--segment_size', default=SEGMENT_SIZE, type=int, help='Amount of bytes of the segments taken from the samples.')
+    parser.add_argument('--split_lines', action='store_true', help='Flag to use each line of the sample files as a sample.')
+
+    return parser
+
+
+def main(args):
+    ##### Train dictionary
+    samples = read_samples(args.samples, args.split_lines)
+    dictionary = train_dictionary(samples, args.dictionary_size, args.segment_size)
+
+    ##### Save dictionary
+    with open(args.dictionary_path, "wb") as dictionary_file:
+        dictionary_file.write(dictionary)
+
+    print(f"Trained dictionary {get_dictionary_id(dictionary):08x} with {len(dictionary)} bytes from {len(samples)} samples.")
+
+
+
+if __name__ == "__main__":
+    ##### Read command line
+    main(create_parser().parse_args(sys.argv[1:]))
@@ -1,141 +1,403 @@
 import os
 import sys
-import math
+import mmap
+import zlib
+import functools
 import argparse
 import numpy as np
 
-from PIL import Image
 from pathlib import Path
-from decimal import getcontext
+from collections import deque
 from bitstring import BitArray
 
-from LZ77 import LZ77
+from LZ77 import LZ77, MATCH_FINDERS, ENCODING_FORMATS
+from hash_chain import HashChainMatchFinder
+from instrumentation import CodingStats, measure
+from image_filters import filter_image, IMAGE_FILTERS, NONE_FILTER
+from compressibility import is_incompressible
+from dictionary import get_dictionary_id, read_dictionary
+from result_cache import ResultCache, CACHE_SIZE
+from container import (write_container, pack_container, write_container_header, write_block, write_blocks_end,
+                       HEADER_SIZE, EXTENSION_SIZE, TEXT_FILE, IMAGE_FILE, RAW_FILE, BLOCKED_PAYLOAD, INDEPENDENT_BLOCKS, PLANAR_CHANNELS, TOKEN_FORMAT,
+                       STORED_PAYLOAD, LZ77_BLOCK, STORED_BLOCK)
 
-# Import Adaptative Huffman Encoder
-sys.path.insert(1, "../Adaptative_Huffman_Coding")
-from huffman_encoder import HuffmanEncoder
+##### Entropy coders available for the second encoding step.
+ENTROPY_CODERS = ['canonical', 'adaptive']
+##### Amount of preset dictionaries whose hash chains are kept.
+DICTIONARY_MATCH_FINDERS = 4
+##### Image modes whose pixels are bytes, and whose decoded array is saved back as the same image.
+IMAGE_MODES = ['L', 'LA', 'P', 'RGB', 'RGBA']
+
+# NOTE: PIL, the Huffman coders and the process pools are only imported by the code that uses them,
+#       so encoding a text or raw file without a second encoding step does not wait for them to load.
 
 
 ########## LZ77 Encoding Class
 
 class Encoder():
 
-    def __init__(self, file_path):
-        ##### Verify if file is text or image.
-        self.text_file = True if os.path.splitext(file_path)[-1] == '.txt' else False
-        ##### Open and read text file
-        if self.text_file:
-            orig_file = open(file_path, "rb")
-            self.sequence = orig_file.read()
-            orig_file.close()
-        ##### Open and read image
+    def __init__(self, file_path, streaming=False, stats=None, image_filter='none', planar=False, raw=False, buffer=None, dictionary=None,
+                 cache=None):
+        ##### Verify if file is text, image or any other file. Raw files are encoded as they are.
+        #     Buffers given instead of a file are encoded as raw files without extension.
+        self.file_path = file_path if buffer is None else ''
+        ##### Optional statistics of the encoding process.
+        self.stats = stats
+        ##### Optional preset dictionary, which primes the search buffer of the sequence.
+        self.dictionary = b'' if dictionary is None else bytes(dictionary)
+        ##### Optional cache of encoded blocks, shared by encoders with the same parameters.
+        self.cache = cache
+        ##### Memory map of text and raw files, closed by 'close'.
+        self.mapped_file = None
+        self.file_type = get_file_type(self.file_path, raw or buffer is not None)
+        ##### Images that PIL can not decode, or whose pixels are not bytes, are encoded as raw files.
+        if self.file_type == IMAGE_FILE:
+            image_array = read_image(file_path)
+            if image_array is None:
+                self.file_type = RAW_FILE
+        ##### Buffers are encoded from memory, without copies.
+        if buffer is not None:
+            self.sequence = memoryview(buffer).cast('B')
+        ##### When streaming, text and raw files are only read while encoding, one block at a time.
+        elif self.file_type != IMAGE_FILE and streaming:
+            self.sequence = None
+        ##### Map text and raw files. Their content is only read while encoding, and never copied.
+        elif self.file_type != IMAGE_FILE:
+            self.sequence = self.__map_file()
+        ##### Open and read image. Pixels are predicted by the image filter, and only the residuals are encoded.
+        #     Planar images have their channels encoded one after another.
         else:
-            image_array = np.array(Image.open(file_path))
             self.dimensions = image_array.shape
-            self.sequence = image_array.flatten()
+            self.image_filter = IMAGE_FILTERS.index(image_filter)
+            self.planar = planar and image_array.ndim == 3
+            self.sequence = np.frombuffer(filter_image(image_array, self.image_filter, self.planar), dtype=np.uint8)
 
+        self.sequence_length = None if self.sequence is None else len(self.sequence)
 
 
-    def encode_sequence(self, search_buffer_size, look_ahead_buffer_size, second_encoding_step=False):
-        ##### Instantiate LZ77 Encoder.
-        self.LZ77 = LZ77()
-        self.LZ77.create_buffers(search_buffer_size, look_ahead_buffer_size)
-        self.LZ77.read_sequence(np.frombuffer(self.sequence, dtype=np.uint8))
 
-        ##### Verify if a second encoding step is required.
-        if second_encoding_step:
-            ##### In this case, only the triples are required. LZ77 object does not need to write a bitstring. 
-            self.triples_LZ77 = np.array(self.LZ77.generate_triples())
-            self.__encode_with_Adaptative_HC()
-            # Signaling for second coding
-            self.bitstring.prepend('0b1')
-        else:
-            ##### Only file details need to be added to the bitstring.
-            self.bitstring = self.LZ77.encode_sequence()
-            self.bitstring.prepend('0b0')
+    def encode_sequence(self, search_buffer_size, look_ahead_buffer_size, second_encoding_step=False,
+                        match_finder='window', chain_depth=256, entropy_coder='canonical', workers=1, encoding_format='bits'):
+        ##### Instantiate block encoder.
+        self.block_encoder = BlockEncoder(search_buffer_size, look_ahead_buffer_size, second_encoding_step, match_finder, chain_depth,
+                                          entropy_coder, self.stats, encoding_format, self.dictionary, self.cache)
+
+        ##### Encode the whole sequence as a single block. Workers are used for its entropy coding streams.
+        self.block_type, self.bitstring = self.block_encoder.encode_block(self.sequence, self.block_encoder.dictionary, workers)
+        self.LZ77 = self.block_encoder.LZ77
+
+
+    def encode_stream(self, output, search_buffer_size, look_ahead_buffer_size, block_size, second_encoding_step=False,
+                      match_finder='window', chain_depth=256, workers=1, prime_blocks=True, entropy_coder='canonical',
+                      encoding_format='bits'):
+        ##### Instantiate block encoder.
+        self.block_encoder = BlockEncoder(search_buffer_size, look_ahead_buffer_size, second_encoding_step, match_finder, chain_depth,
+                                          entropy_coder, self.stats, encoding_format, self.dictionary, self.cache)
+
+        ##### Output can be a file path or a writable binary stream.
+        stream = open(output, "wb") if isinstance(output, str) else output
+
+        ##### Write header. Checksum and bits amount are only known at the end, so they are not included.
+        header = self.__get_file_header()
+        header['flags'] |= BLOCKED_PAYLOAD if prime_blocks else BLOCKED_PAYLOAD | INDEPENDENT_BLOCKS
+        header.update(checksum=0, payload_bits=0)
+        self.binary_file_size = write_container_header(stream, header)
 
-        ##### Insert encoder header
-        self.__write_encoder_header()
+        ##### Blocks are written in order, as soon as they are encoded. Their decoded and file offsets are indexed.
+        checksum = self.sequence_length = 0
+        block_index = []
+        for block, (block_type, block_bitstring) in self.__encode_blocks(block_size, workers, prime_blocks):
+            with measure(self.stats, 'file_writing'):
+                block_file_size = write_block(stream, block_type, len(block), block_bitstring)
+            block_index.append([self.sequence_length, self.binary_file_size, block_file_size, len(block)])
+            self.binary_file_size += block_file_size
+            checksum = zlib.crc32(block, checksum)
+            self.sequence_length += len(block)
+
+        ##### Finish payload.
+        self.binary_file_size += write_blocks_end(stream, checksum, block_index)
+        stream.flush()
+        if isinstance(output, str):
+            stream.close()
 
 
     def compute_rate(self):
-        ##### Get sequence and bitstring lengths.
-        bits_used = len(self.bitstring.bin)
-        sequence_length = len(self.sequence)
+        ##### Get bytes used by the binary file. If it was not saved yet, its size is predicted.
+        if hasattr(self, 'binary_file_size'):
+            bits_used = 8 * self.binary_file_size
+        else:
+            bits_used = 8 * (HEADER_SIZE + (len(self.bitstring) + 7) // 8)
 
         ##### Compute rate.
-        rate = bits_used/sequence_length
+        rate = bits_used/self.sequence_length
         return rate
         
 
     def save_binary_file(self, binary_file_path):
-        with open(binary_file_path, "wb") as bin_file:
-            bin_file.write(self.bitstring.bin.encode())
-            bin_file.close()
-      
+        ##### Write bitstring packed in bytes, after the file header.
+        with measure(self.stats, 'file_writing'):
+            write_container(binary_file_path, self.__get_payload_header(), self.bitstring)
+        self.binary_file_size = os.path.getsize(binary_file_path)
 
 
-    ########## Private Methods
+    def get_binary_data(self):
+        ##### Same content as the binary file, kept in memory.
+        binary_data = pack_container(self.__get_payload_header(), self.bitstring)
+        self.binary_file_size = len(binary_data)
+        return binary_data
 
-    def __encode_with_Adaptative_HC(self):
-        # NOTE: Only offsets and match_lengths will be further encoded
-        offsets = self.triples_LZ77[:, 0]
-        match_lengths = self.triples_LZ77[:, 1]
-        codes = self.triples_LZ77[:, 2]
-    
-        ##### Generate bitstrings
-        offset_bs = self.__generate_Adaptative_HC_bitstrings(offsets)
-        length_bs = self.__generate_Adaptative_HC_bitstrings(match_lengths)
-        codes_bs  = self.__generate_Adaptative_HC_bitstrings(codes)
 
-        ##### Get total amount of triples.
-        triples_amount = self.triples_LZ77.shape[0]
-        bits_to_write_triples_amount = len(bin(triples_amount)[2:])
+    def close(self):
+        ##### Unmap the file. The sequence and the encoders holding views of it are released first, since
+        #     the map can not be closed while they exist. The encoded bitstring and its rate are kept.
+        self.sequence = self.block_encoder = self.LZ77 = None
+        if self.mapped_file is not None:
+            self.mapped_file.close()
+            self.mapped_file = None
 
-        ##### Create bitstring
-        self.bitstring = BitArray(f'uint:5={bits_to_write_triples_amount}, uint:{bits_to_write_triples_amount}={triples_amount}')
 
-        ##### Write offsets and match lengths bitstrings in the main bitstring.
-        self.__write_bitstring_in_main_bitstring(offset_bs)
-        self.__write_bitstring_in_main_bitstring(length_bs)
-        self.__write_bitstring_in_main_bitstring(codes_bs)
+    def __enter__(self):
+        return self
 
-        return 
 
+    def __exit__(self, *exception_info):
+        self.close()
 
-    def __write_encoder_header(self):
-        ##### Bit indicating if is image or text.
-        encoder_header = '0b0' if self.text_file else '0b1'
 
-        ##### Include headers for image.
-        if not self.text_file:
-            # Number of channels
-            three_channel_image = '1' if (len(self.dimensions) == 3) and (self.dimensions[-1] == 3) else '0'
-            encoder_header += three_channel_image
 
-            # Width and height difference
+    ########## Private Methods
+
+    def __map_file(self):
+        with open(self.file_path, "rb") as orig_file:
+            ##### Empty files can not be mapped.
+            if os.fstat(orig_file.fileno()).st_size == 0:
+                return b''
+            self.mapped_file = mmap.mmap(orig_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return memoryview(self.mapped_file)
+
+
+    def __read_blocks(self, block_size):
+        ##### Sequences already in memory are split in slices.
+        if self.sequence is not None:
+            for block_start in range(0, len(self.sequence), block_size):
+                yield self.sequence[block_start:block_start + block_size]
+            return
+
+        ##### Otherwise, the file is read one block at a time.
+        with open(self.file_path, "rb") as orig_file:
+            block = orig_file.read(block_size)
+            while block:
+                yield block
+                block = orig_file.read(block_size)
+
+
+    def __encode_blocks(self, block_size, workers, prime_blocks):
+        search_buffer_size = self.block_encoder.search_buffer_size
+
+        ##### Pair each block with the symbols that precede it. They are the initial search buffer
+        #     of the block, so the sliding window is carried across block boundaries.
+        #     The preset dictionary precedes the first block, and every block when they are independent.
+        def blocks_with_history():
+            history = self.block_encoder.dictionary
+            for block in self.__read_blocks(block_size):
+                yield block, history if prime_blocks else self.block_encoder.dictionary
+                history = (history + bytes(block[-search_buffer_size:]))[-search_buffer_size:]
+
+        ##### A single worker encodes blocks as they are read.
+        if workers == 1:
+            for block, history in blocks_with_history():
+                yield block, self.block_encoder.encode_block(block, history)
+            return
+
+        ##### Otherwise, blocks are encoded concurrently. Only a few blocks per worker are
+        #     submitted ahead of the one being written, so memory usage stays bounded.
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending_blocks = deque()
+            for block, history in blocks_with_history():
+                ##### Views of the mapped file can not be sent to workers, so they are copied.
+                block = bytes(block) if isinstance(block, memoryview) else block
+                pending_blocks.append((block, executor.submit(self.block_encoder.encode_block, block, history)))
+                if len(pending_blocks) > 2 * workers:
+                    block, future = pending_blocks.popleft()
+                    yield block, future.result()
+            while pending_blocks:
+                block, future = pending_blocks.popleft()
+                yield block, future.result()
+
+
+    def __get_payload_header(self):
+        ##### Stored sequences are signaled in the header, since the payload has no block header.
+        header = self.__get_file_header()
+        header['flags'] |= STORED_PAYLOAD if self.block_type == STORED_BLOCK else 0
+        return dict(header, checksum=zlib.crc32(self.sequence))
+
+
+    def __get_file_header(self):
+        ##### Text and raw files have no dimensions. Raw files have their extension saved.
+        if self.file_type != IMAGE_FILE:
+            flags, image_filter, channels, height, width = 0, NONE_FILTER, 0, 0, 0
+            extension = os.path.splitext(self.file_path)[-1].encode()[:EXTENSION_SIZE] if self.file_type == RAW_FILE else b''
+        ##### Images have their exact dimensions and filter saved.
+        else:
+            image_filter, extension = self.image_filter, b''
+            flags = PLANAR_CHANNELS if self.planar else 0
             height, width = self.dimensions[:2]
-            dim_diff = width - height
-            encoder_header += f', int:14={dim_diff}'
+            channels = self.dimensions[2] if len(self.dimensions) == 3 else 1
 
-        ##### Write header
-        self.bitstring.prepend(encoder_header)
+        ##### Token payloads are signaled in the header, so blocks stay byte-aligned.
+        flags |= TOKEN_FORMAT if self.block_encoder.encoding_format == 'tokens' else 0
 
+        return {'file_type': self.file_type, 'flags': flags, 'image_filter': image_filter, 'channels': channels,
+                'height': height, 'width': width, 'extension': extension,
+                'search_buffer_size': self.block_encoder.search_buffer_size,
+                'look_ahead_buffer_size': self.block_encoder.look_ahead_buffer_size,
+                'dictionary_id': get_dictionary_id(self.dictionary) if self.dictionary else 0}
 
-    def __generate_Adaptative_HC_bitstrings(self, sequence):
-        ##### Get symbols amount
-        symbols_amount = len(np.unique(sequence))
 
-        ##### Instantiate Huffman Encoder
-        huffman_encoder = HuffmanEncoder(symbols_amount=symbols_amount)
-        huffman_encoder.read_sequence_array(sequence)
 
-        ##### Generate bitstrings
-        huffman_encoder.instantiate_bitstream()
-        huffman_encoder.encode_with_adaptative_hc(verbose=False)
-        bitstring = huffman_encoder.get_binary_string()
+########## LZ77 Block Encoding Class
+
+# NOTE: Block encoders only hold encoding parameters until a block is encoded,
+#       so they can be sent to worker processes without the file content.
+
+class BlockEncoder():
+
+    def __init__(self, search_buffer_size, look_ahead_buffer_size, second_encoding_step=False,
+                 match_finder='window', chain_depth=256, entropy_coder='canonical', stats=None, encoding_format='bits', dictionary=b'',
+                 cache=None):
+        assert entropy_coder in ENTROPY_CODERS, f"Entropy coder must be one of {ENTROPY_CODERS}."
+        assert encoding_format in ENCODING_FORMATS, f"Encoding format must be one of {ENCODING_FORMATS}."
+        assert not (second_encoding_step and encoding_format == 'tokens'), "Tokens can not be further encoded."
+
+        ##### Save encoding parameters.
+        self.search_buffer_size = search_buffer_size
+        self.look_ahead_buffer_size = look_ahead_buffer_size
+        self.second_encoding_step = second_encoding_step
+        self.match_finder = match_finder
+        self.chain_depth = chain_depth
+        self.entropy_coder = entropy_coder
+        self.encoding_format = encoding_format
+        self.stats = stats
+        ##### Preset dictionary. Only its end fits in the search buffer.
+        self.dictionary = bytes(dictionary[-search_buffer_size:]) if dictionary else b''
+        ##### Optional cache of encoded blocks.
+        self.cache = cache
+
+
+    def encode_block(self, block, history=b'', workers=1):
+        ##### Without a cache, the block is always encoded.
+        if self.cache is None:
+            return self.__encode_block(block, history, workers)
+
+        ##### Blocks already encoded with the same history and parameters are taken from the cache.
+        with measure(self.stats, 'cache_lookup'):
+            cache_key = self.cache.get_key(block, history, [self.search_buffer_size, self.look_ahead_buffer_size, self.second_encoding_step,
+                                                            self.match_finder, self.chain_depth, self.entropy_coder, self.encoding_format])
+            cached_result = self.cache.get(cache_key)
+        if self.stats is not None:
+            self.stats.count('cache_hits' if cached_result is not None else 'cache_misses')
+        if cached_result is not None:
+            block_type, block_bytes, bits_amount = cached_result
+            self.LZ77 = None
+            self.bitstring = BitArray(bytes=block_bytes, length=bits_amount)
+            return block_type, self.bitstring
+
+        ##### Otherwise, the block is encoded and its result is cached.
+        block_type, bitstring = self.__encode_block(block, history, workers)
+        self.cache.put(cache_key, block_type, bitstring.tobytes(), len(bitstring))
+        return block_type, bitstring
+
 
-        return bitstring
+
+    def __getstate__(self):
+        ##### Statistics are kept in this process. Blocks encoded by workers are not measured.
+        return dict(self.__dict__, stats=None)
+
+
+
+    ########## Private Methods
+
+    def __encode_block(self, block, history, workers):
+        ##### Blocks that are not expected to shrink, such as compressed or random data, are stored without matching.
+        with measure(self.stats, 'compressibility_probe'):
+            incompressible = is_incompressible(block)
+        if incompressible:
+            self.LZ77 = None
+            return self.__store_block(block)
+
+        ##### Instantiate LZ77 Encoder. Symbols preceding the block are used as initial search buffer.
+        self.LZ77 = LZ77(self.stats)
+        self.LZ77.create_buffers(self.search_buffer_size, self.look_ahead_buffer_size, self.match_finder, self.chain_depth)
+        self.LZ77.prime_search_buffer(history, self.__get_primed_match_finder(history))
+        self.LZ77.read_sequence(np.frombuffer(block, dtype=np.uint8))
+
+        ##### Tokens are byte-aligned, so they are written without any signaling bit.
+        if self.encoding_format == 'tokens':
+            self.bitstring = BitArray(bytes=self.LZ77.encode_sequence_as_tokens())
+        ##### Verify if a second encoding step is required.
+        elif self.second_encoding_step:
+            ##### In this case, only the triples are required. LZ77 object does not need to write a bitstring. 
+            self.triples_LZ77 = self.LZ77.generate_triples()
+            with measure(self.stats, 'entropy_coding'):
+                self.__encode_with_HC(workers)
+            # Signaling for second coding, followed by the entropy coder: '1' for canonical and '0' for adaptative.
+            self.bitstring.prepend('0b11' if self.entropy_coder == 'canonical' else '0b10')
+        else:
+            ##### Only file details need to be added to the bitstring.
+            self.bitstring = self.LZ77.encode_sequence()
+            self.bitstring.prepend('0b0')
+
+        ##### Blocks are also stored when their encoding is not shorter than them.
+        if len(self.bitstring) >= 8 * len(block):
+            return self.__store_block(block)
+
+        return LZ77_BLOCK, self.bitstring
+
+
+    def __get_primed_match_finder(self, history):
+        ##### Only the dictionary is primed often enough to keep its hash chains.
+        if self.match_finder != 'hash_chain' or not self.dictionary or bytes(history) != self.dictionary:
+            return None
+        return get_dictionary_match_finder(self.dictionary, self.search_buffer_size, self.chain_depth)
+
+
+    def __store_block(self, block):
+        self.bitstring = BitArray(bytes=bytes(block))
+
+        ##### Update statistics.
+        if self.stats is not None:
+            self.stats.count('stored_blocks')
+            self.stats.count('stored_bytes', len(block))
+
+        return STORED_BLOCK, self.bitstring
+
+
+    def __encode_with_HC(self, workers):
+        ##### Offsets, match lengths and codes are encoded as independent streams.
+        streams = [self.triples_LZ77['offset'], self.triples_LZ77['match_length'], self.triples_LZ77['code']]
+
+        ##### Generate bitstrings. With more than one worker, the streams are encoded concurrently.
+        if workers == 1:
+            stream_bitstrings = [generate_HC_bitstring(stream, self.entropy_coder) for stream in streams]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=min(workers, len(streams))) as executor:
+                stream_bitstrings = list(executor.map(generate_HC_bitstring, streams, [self.entropy_coder] * len(streams)))
+
+        ##### Get total amount of triples.
+        triples_amount = len(self.triples_LZ77)
+        bits_to_write_triples_amount = len(bin(triples_amount)[2:])
+
+        ##### Create bitstring
+        self.bitstring = BitArray(f'uint:5={bits_to_write_triples_amount}, uint:{bits_to_write_triples_amount}={triples_amount}')
+
+        ##### Write offsets, match lengths and codes bitstrings in the main bitstring, in this order.
+        for stream_bitstring in stream_bitstrings:
+            self.__write_bitstring_in_main_bitstring(stream_bitstring)
+
+        return 
 
 
     def __write_bitstring_in_main_bitstring(self, bitstring):
@@ -145,7 +407,7 @@ class Encoder():
         self.bitstring.append(f'uint:5={bits_to_write_bits_amount}, uint:{bits_to_write_bits_amount}={bits_amount}')
 
         ##### Write bitstring
-        self.bitstring.append(f'bin={bitstring}')
+        self.bitstring.append(bitstring)
 
         return
 
@@ -153,6 +415,75 @@ class Encoder():
 
 ########## Auxiliary Methods
 
+def get_file_type(file_path, raw=False):
+    ##### Files are images if they have the extension of a format PIL can open. Save-only formats are raw files.
+    extension = os.path.splitext(file_path)[-1].lower()
+    if raw:
+        return RAW_FILE
+    if extension == '.txt':
+        return TEXT_FILE
+    from PIL import Image
+    if Image.registered_extensions().get(extension) in Image.OPEN:
+        return IMAGE_FILE
+    return RAW_FILE
+
+
+def read_image(file_path):
+    ##### Pixels of the image, or None if PIL can not decode it. Some formats are opened by PIL but need
+    #     external programs or handlers to be decoded, and files may not match their extension.
+    from PIL import Image
+    try:
+        with Image.open(file_path) as image:
+            ##### Other modes, such as bilevel or 16-bit images, would not be decoded as the same image.
+            if image.mode not in IMAGE_MODES:
+                return None
+            ##### The palette is not saved, so palette images are encoded with their colors.
+            if image.mode == 'P':
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+            image_array = np.array(image)
+    except (OSError, ValueError):
+        return None
+
+    return image_array if image_array.dtype == np.uint8 else None
+
+
+# NOTE: Hash chains of preset dictionaries are indexed once per process, and extended by each encoded sequence,
+#       so short sequences do not pay for indexing the whole dictionary.
+
+@functools.lru_cache(maxsize=DICTIONARY_MATCH_FINDERS)
+def get_dictionary_match_finder(dictionary, search_buffer_size, chain_depth):
+    return HashChainMatchFinder(dictionary, search_buffer_size, chain_depth).index_sequence()
+
+
+# NOTE: Stream bitstrings are generated by module functions, so they can be sent to worker processes.
+
+def generate_HC_bitstring(sequence, entropy_coder='canonical'):
+    ##### Each stream is coded with its own static code table.
+    if entropy_coder == 'canonical':
+        from canonical_huffman import CanonicalHuffmanEncoder
+        huffman_encoder = CanonicalHuffmanEncoder()
+        huffman_encoder.read_sequence_array(sequence)
+        return huffman_encoder.encode()
+
+    ##### Import Adaptative Huffman Encoder. It is only required by this entropy coder.
+    sys.path.insert(1, "../Adaptative_Huffman_Coding")
+    from huffman_encoder import HuffmanEncoder
+
+    ##### Get symbols amount
+    symbols_amount = len(np.unique(sequence))
+
+    ##### Instantiate Huffman Encoder
+    huffman_encoder = HuffmanEncoder(symbols_amount=symbols_amount)
+    huffman_encoder.read_sequence_array(sequence)
+
+    ##### Generate bitstrings
+    huffman_encoder.instantiate_bitstream()
+    huffman_encoder.encode_with_adaptative_hc(verbose=False)
+    bitstring = BitArray(bin=huffman_encoder.get_binary_string())
+
+    return bitstring
+
+
 def menage_binary_file_path(args):
     ##### Define directory path.
     if args.binary_file_path:
@@ -167,25 +498,68 @@ def menage_binary_file_path(args):
         directory.mkdir(parents=True)
 
 
-
-if __name__ == "__main__":
+def create_parser(prog=None):
     ##### Receives file to be compressed from command line.
-    parser = argparse.ArgumentParser(description="Receives file to be encoded and binary filepath.")
-    
+    parser = argparse.ArgumentParser(prog=prog, description="Receives file to be encoded and binary filepath.")
+
     parser.add_argument('--file_to_compress', required=True, help='Path to file to be compressed.')
     parser.add_argument('--binary_file_path', required=False, help="Path to save binary file. "
                                                                    "If folders do not exist, they'll be created.")
     parser.add_argument('--search_buffer_length', default=31, type=int, help='Buffer size with the already encoded symbols.')
     parser.add_argument('--look_ahead_buffer_length', default=15, type=int, help='Buffer size with symbols to be encoded.')
     parser.add_argument('--second_encoding_step', action='store_true', help='Flag to set a second encoding step.')
-
-    ##### Read command line
-    args = parser.parse_args(sys.argv[1:])
-    
+    parser.add_argument('--match_finder', default='window', choices=MATCH_FINDERS, help='Engine used for finding matches.')
+    parser.add_argument('--chain_depth', default=256, type=int, help='Maximum amount of candidates visited by the hash chains.')
+    parser.add_argument('--entropy_coder', default='canonical', choices=ENTROPY_CODERS, help='Huffman coder used in the second encoding step.')
+    parser.add_argument('--encoding_format', default='bits', choices=ENCODING_FORMATS, help='Triples packed in bits or written as '
+                                                                                           'byte-aligned tokens, without second encoding step.')
+    parser.add_argument('--block_size', type=int, help='Encode the file as a stream of blocks with this amount of bytes. '
+                                                       "In this mode, '-' as binary file path writes to the standard output.")
+    parser.add_argument('--workers', default=1, type=int, help='Amount of processes encoding blocks concurrently. '
+                                                                 'Without blocks, the second encoding step streams are encoded concurrently.')
+    parser.add_argument('--independent_blocks', action='store_true', help='Flag to encode each block without the previous ones.')
+    parser.add_argument('--stats', help='Path to save encoding statistics as JSON.')
+    parser.add_argument('--image_filter', default='none', choices=IMAGE_FILTERS, help='Prediction filter applied to the rows of images.')
+    parser.add_argument('--planar', action='store_true', help='Flag to encode the channels of images one after another.')
+    parser.add_argument('--raw', action='store_true', help='Flag to encode any file, including images, as raw bytes.')
+    parser.add_argument('--dictionary', help='Path to a preset dictionary, which primes the search buffer. It is required for decoding.')
+    parser.add_argument('--cache_directory', help='Directory of a cache of encoded blocks, reused by later encodings with the same parameters.')
+    parser.add_argument('--cache_size', default=CACHE_SIZE, type=int, help='Largest amount of bytes kept in the cache directory.')
+
+    return parser
+
+
+def main(args):
     ##### Menage binary file path
     menage_binary_file_path(args)   
 
-    ##### Encode source
-    encoder = Encoder(args.file_to_compress)
-    encoder.encode_sequence(args.search_buffer_length, args.look_ahead_buffer_length, args.second_encoding_step)
-    encoder.save_binary_file(args.binary_file_path)
\ No newline at end of file
+    ##### Statistics are only collected if they are saved.
+    stats = CodingStats() if args.stats else None
+    dictionary = read_dictionary(args.dictionary) if args.dictionary else None
+    cache = ResultCache(args.cache_directory, args.cache_size) if args.cache_directory else None
+
+    ##### Encode source as a stream of blocks
+    if args.block_size:
+        with Encoder(args.file_to_compress, streaming=True, stats=stats, image_filter=args.image_filter, planar=args.planar,
+                     raw=args.raw, dictionary=dictionary, cache=cache) as encoder:
+            output = sys.stdout.buffer if args.binary_file_path == '-' else args.binary_file_path
+            encoder.encode_stream(output, args.search_buffer_length, args.look_ahead_buffer_length, args.block_size,
+                                  args.second_encoding_step, args.match_finder, args.chain_depth,
+                                  args.workers, not args.independent_blocks, args.entropy_coder, args.encoding_format)
+    ##### Encode source at once
+    else:
+        with Encoder(args.file_to_compress, stats=stats, image_filter=args.image_filter, planar=args.planar, raw=args.raw,
+                     dictionary=dictionary, cache=cache) as encoder:
+            encoder.encode_sequence(args.search_buffer_length, args.look_ahead_buffer_length, args.second_encoding_step,
+                                    args.match_finder, args.chain_depth, args.entropy_coder, args.workers, args.encoding_format)
+            encoder.save_binary_file(args.binary_file_path)
+
+    ##### Save statistics
+    if stats is not None:
+        stats.dump(args.stats)
+
+
+
+if __name__ == "__main__":
+    ##### Read command line
+    main(create_parser().parse_args(sys.argv[1:]))
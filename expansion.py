@@ -0,0 +1,80 @@
+import numpy as np
+
+
+########## Run Expansion
+
+# NOTE: Both the triples and the tokens are decoded as runs made of a literal run and a match. Tokens have
+#       their literals first, and triples have their match first, followed by a single literal. The position
+#       of every literal is known from the run lengths, so all literals of a group of runs are placed at once,
+#       and only the matches are copied one at a time. Runs are expanded at the end of a window, which starts
+#       with the history and only keeps its last 'history_size' bytes after each yielded chunk.
+
+def iter_expanded_runs(runs_chunks, history, history_size, chunk_size=None, literals_first=True):
+    ##### 'runs_chunks' yields literal counts, offsets, match lengths and literals of consecutive runs. Chunks
+    #     of at least 'chunk_size' bytes are yielded, or the whole sequence at once without 'chunk_size'.
+    window = bytearray(history)
+    chunk_start = len(window)
+
+    for literal_counts, offsets, match_lengths, literals in runs_chunks:
+        literal_counts, offsets, match_lengths = [np.asarray(field, dtype=np.int64) for field in [literal_counts, offsets, match_lengths]]
+        literals = np.frombuffer(literals, dtype=np.uint8)
+        run_ends = np.cumsum(literal_counts + match_lengths)
+
+        ##### Runs are expanded in groups that complete the current chunk, so the window stays bounded.
+        group_start = literals_start = 0
+        while group_start < len(run_ends):
+            if chunk_size is None:
+                group_end = len(run_ends)
+            else:
+                missing_bytes = max(chunk_size - (len(window) - chunk_start), 1)
+                group_output_start = run_ends[group_start - 1] if group_start else 0
+                group_end = min(int(np.searchsorted(run_ends, group_output_start + missing_bytes)) + 1, len(run_ends))
+
+            group = slice(group_start, group_end)
+            literals_start = expand_runs(window, literal_counts[group], offsets[group], match_lengths[group], literals,
+                                         literals_start, literals_first)
+            group_start = group_end
+
+            ##### Yield complete chunk and keep only the history.
+            if chunk_size is not None and len(window) - chunk_start >= chunk_size:
+                yield bytes(window[chunk_start:])
+                del window[:max(len(window) - history_size, 0)]
+                chunk_start = len(window)
+
+    ##### Yield last chunk.
+    if len(window) > chunk_start:
+        yield bytes(window[chunk_start:])
+
+
+def expand_runs(window, literal_counts, offsets, match_lengths, literals, literals_start, literals_first=True):
+    ##### Append the runs to the window. Returns the position of the first literal of the next runs.
+    run_lengths = literal_counts + match_lengths
+    output_start = len(window)
+    run_starts = output_start + np.cumsum(run_lengths) - run_lengths
+    literal_starts, match_starts = (run_starts, run_starts + literal_counts) if literals_first else (run_starts + match_lengths, run_starts)
+    window += bytes(int(run_lengths.sum()))
+
+    ##### Place all literals at once. Each literal follows the previous one of its run.
+    literals_amount = int(literal_counts.sum())
+    literal_offsets = np.cumsum(literal_counts) - literal_counts
+    literal_positions = np.repeat(literal_starts - literal_offsets, literal_counts) + np.arange(literals_amount)
+    window_array = np.frombuffer(window, dtype=np.uint8)
+    window_array[literal_positions] = literals[literals_start:literals_start + literals_amount]
+    ##### The window can not be resized while it is viewed as an array.
+    del window_array
+
+    ##### Copy matches in order. If the pattern does not reach the match, it is copied at once. Else, the
+    #     already copied part repeats the pattern, so the copied amount doubles at each step.
+    matched = match_lengths > 0
+    for match_start, offset, match_length in zip(match_starts[matched].tolist(), offsets[matched].tolist(), match_lengths[matched].tolist()):
+        pattern_start = match_start - offset
+        if offset >= match_length:
+            window[match_start:match_start + match_length] = window[pattern_start:pattern_start + match_length]
+        else:
+            copied = 0
+            while copied < match_length:
+                chunk = min(offset + copied, match_length - copied)
+                window[match_start + copied:match_start + copied + chunk] = window[pattern_start:pattern_start + chunk]
+                copied += chunk
+
+    return literals_start + literals_amount
@@ -1,13 +1,18 @@
 import os
 import sys
+import json
 import time
 import argparse 
-import numpy as np
-import pandas as pd
-from scipy.stats import entropy
 
-from encoder import Encoder, menage_binary_file_path
+from LZ77 import MATCH_FINDERS, ENCODING_FORMATS
+from compressibility import compute_entropy
+from encoder import Encoder, menage_binary_file_path, ENTROPY_CODERS
+from image_filters import IMAGE_FILTERS
 from decoder import Decoder, menage_decoded_file_path
+from instrumentation import CodingStats
+from dictionary import read_dictionary
+from result_cache import ResultCache, CACHE_SIZE
+from tuning import tune_buffer_sizes, choose_configuration, SAMPLE_SIZE, SAMPLES_AMOUNT
 
 
 def print_process_duration(starting_time, ending_time, process_name):
@@ -29,71 +34,130 @@ def print_process_duration(starting_time, ending_time, process_name):
     print(process_name + ' took ' + hours_string + minutes_string + seconds_string + '.')
 
 
-if __name__ == "__main__":
+def create_parser(prog=None):
     ##### Receives file to be compressed from command line.
-    parser = argparse.ArgumentParser(description="Receives file to be encoded and some encoding options.")
-    
+    parser = argparse.ArgumentParser(prog=prog, description="Receives file to be encoded and some encoding options.")
+
     parser.add_argument('--file_to_compress', required=True, help='Path to file to be compressed.')
     parser.add_argument('--search_buffer_length', default=31, type=int, help='Buffer size with the already encoded symbols.')
     parser.add_argument('--look_ahead_buffer_length', default=15, type=int, help='Buffer size with symbols to be encoded.')
     parser.add_argument('-2', '--second_encoding_step', action='store_true', help='Flag to set a second encoding step.')
-    parser.add_argument('-c', '--compare_diff_buffers', action='store_true', help='Evaluate performance with different buffer sizes.')
+    parser.add_argument('--match_finder', default='window', choices=MATCH_FINDERS, help='Engine used for finding matches.')
+    parser.add_argument('--chain_depth', default=256, type=int, help='Maximum amount of candidates visited by the hash chains.')
+    parser.add_argument('--entropy_coder', default='canonical', choices=ENTROPY_CODERS, help='Huffman coder used in the second encoding step.')
+    parser.add_argument('--encoding_format', default='bits', choices=ENCODING_FORMATS, help='Triples packed in bits or written as '
+                                                                                           'byte-aligned tokens, without second encoding step.')
+    parser.add_argument('--block_size', type=int, help='Encode the file as a stream of blocks with this amount of bytes.')
+    parser.add_argument('--workers', default=1, type=int, help='Amount of processes coding blocks concurrently. '
+                                                                 'Without blocks, the second encoding step streams are coded concurrently.')
+    parser.add_argument('--independent_blocks', action='store_true', help='Flag to encode each block without the previous ones.')
+    parser.add_argument('--stats', help='Path to save encoding and decoding statistics as JSON.')
+    parser.add_argument('--image_filter', default='none', choices=IMAGE_FILTERS, help='Prediction filter applied to the rows of images.')
+    parser.add_argument('--planar', action='store_true', help='Flag to encode the channels of images one after another.')
+    parser.add_argument('--raw', action='store_true', help='Flag to encode any file, including images, as raw bytes.')
+    parser.add_argument('--dictionary', help='Path to a preset dictionary, which primes the search buffer.')
+    parser.add_argument('--cache_directory', help='Directory of a cache of encoded blocks, reused by later encodings with the same parameters.')
+    parser.add_argument('--cache_size', default=CACHE_SIZE, type=int, help='Largest amount of bytes kept in the cache directory.')
+    parser.add_argument('-a', '--auto_tune', action='store_true', help='Choose buffer sizes by encoding samples of the file. '
+                                                                       'Values passed for the buffer sizes are disregarded.')
+    parser.add_argument('--time_budget', type=float, help='When tuning, maximum predicted encoding time in seconds.')
+    parser.add_argument('--ratio_budget', type=float, help='When tuning, minimum predicted compression ratio.')
+    parser.add_argument('--sample_size', default=SAMPLE_SIZE, type=int, help='When tuning, amount of bytes of each sample.')
+    parser.add_argument('--samples_amount', default=SAMPLES_AMOUNT, type=int, help='When tuning, amount of samples.')
     parser.add_argument('--binary_file_path', required=False, help="Path to save binary file. "
                                                                    "If folders do not exist, they'll be created.")
     parser.add_argument('--decoded_file_path', required=False, help="Path to save decoded file. "
                                                                     "If folders do not exist, they'll be created.")
 
-    ##### Read command line
-    args = parser.parse_args(sys.argv[1:])
+    return parser
+
 
+def main(args):
     ##### Menage binary file path
     menage_binary_file_path(args)
 
     ##### Menage decoded file path
     menage_decoded_file_path(args)
 
-    ##### Define buffers sizes
-    if args.compare_diff_buffers:
-        buffer_sizes = [[15, 7], [31, 15], [63, 31]]
+    ##### Read source
+    encoding_stats = CodingStats() if args.stats else None
+    dictionary = read_dictionary(args.dictionary) if args.dictionary else None
+    cache = ResultCache(args.cache_directory, args.cache_size) if args.cache_directory else None
+    encoder = Encoder(args.file_to_compress, stats=encoding_stats, image_filter=args.image_filter, planar=args.planar,
+                      raw=args.raw, dictionary=dictionary, cache=cache)
+
+    ##### Define buffers sizes. When tuning, they are chosen by encoding samples of the source.
+    buffers = [args.search_buffer_length, args.look_ahead_buffer_length]
+    if args.auto_tune:
+        tuning_start = time.time()
+        evaluations = tune_buffer_sizes(encoder.sequence, args.second_encoding_step, args.match_finder, args.chain_depth,
+                                        args.entropy_coder, args.workers, args.sample_size, args.samples_amount,
+                                        args.encoding_format)
+        configuration = choose_configuration(evaluations, encoder.sequence_length, args.time_budget, args.ratio_budget)
+        buffers = [configuration['search_buffer_size'], configuration['look_ahead_buffer_size']]
+        ##### Print predictions
+        for evaluation in evaluations:
+            print(f"Search buffer {evaluation['search_buffer_size']:>6}, look ahead buffer {evaluation['look_ahead_buffer_size']:>4}: "
+                  f"predicted ratio {evaluation['ratio']:6.3f}, {evaluation['MBps']:7.3f} MB/s, "
+                  f"{evaluation['predicted_seconds']:8.2f} seconds.")
+        print_process_duration(tuning_start, time.time(), "Tuning Process")
+        print("---------------------------------------------------------------------\n")
+
+    ##### Printe buffer sizes:
+    print(f"##### Search buffer size:     {buffers[0]};")
+    print(f"##### Look ahead buffer size: {buffers[1]}.\n")
+    
+    ##### Encode source
+    binary_path, extension = os.path.splitext(args.binary_file_path)
+    args.binary_file_path = binary_path + f'_{buffers[0]}_{buffers[1]}' + extension
+    encoding_start = time.time()
+    ##### Blocks are written while they are encoded.
+    if args.block_size:
+        encoder.encode_stream(args.binary_file_path, *buffers, args.block_size, args.second_encoding_step,
+                              args.match_finder, args.chain_depth, args.workers, not args.independent_blocks,
+                              args.entropy_coder, args.encoding_format)
+        encoding_finish = time.time()
     else:
-        buffer_sizes = [[args.search_buffer_length, args.look_ahead_buffer_length]]
-
-    for buffers in buffer_sizes:
-        ##### Printe buffer sizes:
-        print(f"##### Search buffer size:     {buffers[0]};")
-        print(f"##### Look ahead buffer size: {buffers[1]}.\n")
-        
-        ##### Encode source
-        encoder = Encoder(args.file_to_compress)
-        encoding_start = time.time()
-        encoder.encode_sequence(*buffers, args.second_encoding_step)
+        encoder.encode_sequence(*buffers, args.second_encoding_step, args.match_finder, args.chain_depth, args.entropy_coder,
+                                args.workers, args.encoding_format)
         encoding_finish = time.time()
-        binary_path, extension = os.path.splitext(args.binary_file_path)
-        args.binary_file_path = binary_path + f'_{buffers[0]}_{buffers[1]}' + extension
         encoder.save_binary_file(args.binary_file_path)
-        print_process_duration(encoding_start, encoding_finish, "Encoding Process")
+    print_process_duration(encoding_start, encoding_finish, "Encoding Process")
+    if cache is not None:
+        cache_metrics = cache.get_metrics()
+        print(f"Result cache: {cache_metrics['memory_hits'] + cache_metrics['disk_hits']} hits, {cache_metrics['misses']} misses, "
+              f"{cache_metrics['evictions']} evictions.")
+
+    ##### Compute source entropy. The source is no longer needed, so it is unmapped.
+    source_entropy = compute_entropy(encoder.sequence)
+    encoder.close()
+
+    ##### Compare entropy with achieved rate
+    rate = encoder.compute_rate()
 
-        ##### Compute source entropy
-        source_series = pd.Series(np.frombuffer(encoder.sequence, dtype=np.uint8))
-        counts = source_series.value_counts()
-        source_entropy = entropy(counts, base=2)
+    print(f"The first-order source entropy is: {source_entropy:.5f} bits per symbol;")
+    print(f"The achieved rate was            : {rate:.5f} bits per symbol.")
 
-        ##### Compare entropy with achieved rate
-        rate = encoder.compute_rate()
+    ##### Decode source.
+    decoding_stats = CodingStats() if args.stats else None
+    decoder = Decoder(args.binary_file_path, decoding_stats, dictionary=dictionary)
+    decoding_start = time.time()
+    decoder.decode_bitstring(args.workers)
+    decoding_finish = time.time()
+    decoder.save_decoded_file(args.decoded_file_path)
+    print_process_duration(decoding_start, decoding_finish, "Decoding Process")
 
-        print(f"The first-order source entropy is: {source_entropy:.5f} bits per symbol;")
-        print(f"The achieved rate was            : {rate:.5f} bits per symbol.")
+    ##### Compute total time
+    print_process_duration(encoding_start, decoding_finish, "Total Process")
 
-        ##### Decode source.
-        decoder = Decoder(args.binary_file_path)
-        decoding_start = time.time()
-        decoder.decode_bitstring()
-        decoding_finish = time.time()
-        decoder.save_decoded_file(args.decoded_file_path)
-        print_process_duration(decoding_start, decoding_finish, "Decoding Process")
+    ##### Save statistics
+    if args.stats:
+        with open(args.stats, "w") as stats_file:
+            json.dump({'search_buffer_size': buffers[0], 'look_ahead_buffer_size': buffers[1],
+                       'encoder': encoding_stats.to_dict(), 'decoder': decoding_stats.to_dict()}, stats_file, indent=4)
 
-        ##### Compute total time
-        print_process_duration(encoding_start, decoding_finish, "Total Process")
 
-        ##### Separate Execution
-        print("---------------------------------------------------------------------\n")
\ No newline at end of file
+
+if __name__ == "__main__":
+    ##### Read command line
+    main(create_parser().parse_args(sys.argv[1:]))
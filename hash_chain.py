@@ -0,0 +1,116 @@
+import copy
+
+
+########## Hash Chain Match Finder
+
+class HashChainMatchFinder():
+
+    def __init__(self, sequence, search_buffer_size, chain_depth=256, count_candidates=False):
+        ##### Keep the sequence as bytes, since indexing them is much faster than indexing Numpy arrays.
+        self.sequence = bytes(sequence)
+        self.search_buffer_size = search_buffer_size
+        self.chain_depth = chain_depth
+
+        ##### Heads of the chains, indexed by the 3-byte prefix starting at each position.
+        self.heads = {}
+        ##### Previous position with the same prefix. A ring larger than the search buffer is enough,
+        #     since positions that left the search buffer are never followed.
+        ring_size = 1 << search_buffer_size.bit_length()
+        self.ring_mask = ring_size - 1
+        self.previous = [-1] * ring_size
+
+        ##### Last position of each 2-byte and 1-byte prefix, used for short matches.
+        self.last_pair = [-1] * (1 << 16)
+        self.last_byte = [-1] * (1 << 8)
+
+        ##### Amount of positions already indexed for each prefix length.
+        self.indexed_bytes = self.indexed_pairs = self.indexed_triplets = 0
+        ##### Amount of chain candidates visited so far, only counted with 'count_candidates'.
+        self.count_candidates = count_candidates
+        self.compared_candidates = 0
+
+
+    def find_longest_match(self, position, max_match_length):
+        ##### Index every position whose prefix lies entirely before the current one.
+        self.__index_until(position)
+
+        sequence = self.sequence
+        search_buffer_start = max(0, position - self.search_buffer_size)
+        match_length = match_position = 0
+
+        ##### Walk the chain of the 3-byte prefix from the closest to the farthest candidate.
+        if max_match_length >= 3:
+            key = (sequence[position] << 16) | (sequence[position + 1] << 8) | sequence[position + 2]
+            candidate = self.heads.get(key, -1)
+            depth = self.chain_depth
+            while candidate >= search_buffer_start and depth:
+                depth -= 1
+                ##### Matches can not overlap the look ahead buffer.
+                length_limit = min(max_match_length, position - candidate)
+                if (length_limit > match_length) and (sequence[candidate + match_length] == sequence[position + match_length]):
+                    length = 3
+                    while length < length_limit and sequence[candidate + length] == sequence[position + length]:
+                        length += 1
+                    ##### Only strictly longer matches replace the current one, so ties keep the closest position.
+                    if length > match_length:
+                        match_length, match_position = length, candidate
+                        if match_length == max_match_length:
+                            break
+                candidate = self.previous[candidate & self.ring_mask]
+            if self.count_candidates:
+                self.compared_candidates += self.chain_depth - depth
+
+        ##### If no 3-byte match was found, look for the closest 2-byte and 1-byte ones.
+        if match_length == 0 and max_match_length >= 2:
+            candidate = self.last_pair[(sequence[position] << 8) | sequence[position + 1]]
+            if candidate >= search_buffer_start:
+                match_length, match_position = 2, candidate
+        if match_length == 0 and max_match_length >= 1:
+            candidate = self.last_byte[sequence[position]]
+            if candidate >= search_buffer_start:
+                match_length, match_position = 1, candidate
+
+        ##### Return offset and match length.
+        if match_length == 0:
+            return 0, 0
+        return position - match_position, match_length
+
+
+    def index_sequence(self):
+        ##### Index every position of the sequence, so it can be extended without indexing them again.
+        self.__index_until(len(self.sequence))
+        return self
+
+
+    def extend(self, sequence, count_candidates=False):
+        ##### Copy of the match finder for a sequence starting with the current one. Indexed positions are kept.
+        match_finder = copy.copy(self)
+        match_finder.count_candidates = count_candidates
+        match_finder.sequence = bytes(sequence)
+        match_finder.heads = self.heads.copy()
+        match_finder.previous = self.previous.copy()
+        match_finder.last_pair = self.last_pair.copy()
+        match_finder.last_byte = self.last_byte.copy()
+        match_finder.compared_candidates = 0
+        return match_finder
+
+
+    ########## Private Methods
+
+    def __index_until(self, position):
+        sequence = self.sequence
+
+        for index in range(self.indexed_bytes, position):
+            self.last_byte[sequence[index]] = index
+        self.indexed_bytes = max(self.indexed_bytes, position)
+
+        for index in range(self.indexed_pairs, position - 1):
+            self.last_pair[(sequence[index] << 8) | sequence[index + 1]] = index
+        self.indexed_pairs = max(self.indexed_pairs, position - 1)
+
+        heads, previous, ring_mask = self.heads, self.previous, self.ring_mask
+        for index in range(self.indexed_triplets, position - 2):
+            key = (sequence[index] << 16) | (sequence[index + 1] << 8) | sequence[index + 2]
+            previous[index & ring_mask] = heads.get(key, -1)
+            heads[key] = index
+        self.indexed_triplets = max(self.indexed_triplets, position - 2)
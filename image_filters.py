@@ -0,0 +1,113 @@
+import numpy as np
+
+
+##### Prediction filters, as in PNG. The adaptive mode chooses the best filter for each row.
+IMAGE_FILTERS = ['none', 'sub', 'up', 'average', 'paeth', 'adaptive']
+NONE_FILTER, SUB_FILTER, UP_FILTER, AVERAGE_FILTER, PAETH_FILTER, ADAPTIVE_FILTER = range(len(IMAGE_FILTERS))
+
+
+########## Image Filtering
+
+# NOTE: Each row of a filtered image starts with its filter type, followed by the difference between every
+#       byte and its prediction from the left, upper and upper left pixels. With planar channels, the image
+#       is split in one plane per channel, filtered one after another. Unfiltered images are written as they are.
+
+def filter_image(image, image_filter=NONE_FILTER, planar=False):
+    ##### Images are handled as rows of pixels with any amount of channels.
+    image = image.reshape(image.shape[0], image.shape[1], -1)
+    planes = np.split(image, image.shape[2], axis=2) if planar else [image]
+
+    filtered_planes = []
+    for plane in planes:
+        if image_filter == NONE_FILTER:
+            filtered_planes.append(plane.tobytes())
+            continue
+
+        ##### Residuals are computed for the whole plane at once. A fixed filter only computes its own.
+        left, up, upper_left = get_neighbours(plane)
+        if image_filter != ADAPTIVE_FILTER:
+            row_filters = np.full(plane.shape[0], image_filter, dtype=np.uint8)
+            filtered_rows = compute_residuals(plane, image_filter, left, up, upper_left).reshape(plane.shape[0], -1)
+        ##### Adaptive filtering computes every filter, and chooses for each row the one that minimizes the sum
+        #     of the absolute residuals.
+        else:
+            residuals = np.stack([compute_residuals(plane, filter_type, left, up, upper_left) for filter_type in range(ADAPTIVE_FILTER)])
+            signed_residuals = residuals.reshape(ADAPTIVE_FILTER, plane.shape[0], -1).view(np.int8).astype(np.int64)
+            row_filters = np.argmin(np.abs(signed_residuals).sum(axis=2), axis=0).astype(np.uint8)
+            filtered_rows = residuals[row_filters, np.arange(plane.shape[0])].reshape(plane.shape[0], -1)
+
+        ##### Write rows preceded by their filter type.
+        filtered_planes.append(np.column_stack((row_filters, filtered_rows)).tobytes())
+
+    return b''.join(filtered_planes)
+
+
+def unfilter_image(sequence, height, width, channels, image_filter=NONE_FILTER, planar=False):
+    sequence = np.frombuffer(bytes(sequence), dtype=np.uint8)
+    plane_channels = 1 if planar else channels
+    planes_amount = channels if planar else 1
+
+    ##### Unfiltered planes only need to be reshaped.
+    if image_filter == NONE_FILTER:
+        planes = sequence.reshape(planes_amount, height, width, plane_channels)
+        return np.concatenate(planes, axis=2)
+
+    ##### Otherwise, each row starts with its filter type.
+    rows = sequence.reshape(planes_amount, height, 1 + width * plane_channels)
+    planes = [unfilter_plane(plane_rows[:, 1:].reshape(height, width, plane_channels), plane_rows[:, 0]) for plane_rows in rows]
+    return np.concatenate(planes, axis=2)
+
+
+def unfilter_plane(residuals, row_filters):
+    ##### Reconstructed plane, padded with a null row above and a null column on the left.
+    height, width, _ = residuals.shape
+    plane = np.zeros((height + 1, width + 1, residuals.shape[2]), dtype=np.int16)
+    residuals = residuals.astype(np.int16)
+    ##### Only the filters used by some row are evaluated, usually a single one.
+    filter_types = np.unique(row_filters).tolist()
+    row_choices = np.searchsorted(filter_types, row_filters)
+
+    ##### A pixel only depends on its left, upper and upper left neighbours, which are in the two previous
+    #     anti-diagonals. So pixels are reconstructed one anti-diagonal at a time, all at once.
+    for diagonal in range(height + width - 1):
+        rows = np.arange(max(0, diagonal - width + 1), min(diagonal, height - 1) + 1)
+        columns = diagonal - rows
+        left, up, upper_left = plane[rows + 1, columns], plane[rows, columns + 1], plane[rows, columns]
+        if len(filter_types) == 1:
+            predictions = predict(filter_types[0], left, up, upper_left)
+        else:
+            predictions = np.choose(row_choices[rows][:, None], [predict(filter_type, left, up, upper_left) for filter_type in filter_types])
+        plane[rows + 1, columns + 1] = (residuals[rows, columns] + predictions) & 0xFF
+
+    return plane[1:, 1:].astype(np.uint8)
+
+
+
+########## Auxiliary Methods
+
+def get_neighbours(plane):
+    ##### Left, upper and upper left bytes of every byte of the plane. Bytes outside the plane are null.
+    padded_plane = np.pad(plane.astype(np.int16), ((1, 0), (1, 0), (0, 0)))
+    return padded_plane[1:, :-1], padded_plane[:-1, 1:], padded_plane[:-1, :-1]
+
+
+def compute_residuals(plane, filter_type, left, up, upper_left):
+    ##### Differences between the bytes and their predictions, modulo 256.
+    return ((plane.astype(np.int16) - predict(filter_type, left, up, upper_left)) & 0xFF).astype(np.uint8)
+
+
+def predict(filter_type, left, up, upper_left):
+    if filter_type == NONE_FILTER:
+        return np.zeros_like(left)
+    if filter_type == SUB_FILTER:
+        return left
+    if filter_type == UP_FILTER:
+        return up
+    if filter_type == AVERAGE_FILTER:
+        return (left + up) >> 1
+
+    ##### Paeth predictor: the neighbour closest to the gradient estimate, preferring left, up and upper left in this order.
+    estimate = left + up - upper_left
+    left_distance, up_distance, upper_left_distance = np.abs(estimate - left), np.abs(estimate - up), np.abs(estimate - upper_left)
+    return np.where((left_distance <= up_distance) & (left_distance <= upper_left_distance), left,
+                    np.where(up_distance <= upper_left_distance, up, upper_left))
@@ -0,0 +1,75 @@
+import json
+import time
+import numpy as np
+
+from contextlib import contextmanager, nullcontext
+
+
+##### Context used in place of a phase timer when no statistics are collected.
+NO_PHASE = nullcontext()
+
+
+########## Coding Statistics Class
+
+# NOTE: Statistics are opt-in. Objects only measure phases and count events when they receive
+#       an instance of this class, and counters are updated once per block, never per symbol.
+
+class CodingStats():
+
+    def __init__(self, callback=None):
+        ##### Seconds spent in each phase and counted events.
+        self.timers = {}
+        self.counters = {}
+        self.match_length_histogram = np.zeros(0, dtype=np.int64)
+        ##### Function called with the phase name, its duration and these statistics whenever a phase ends.
+        self.callback = callback
+
+
+    @contextmanager
+    def phase(self, phase_name):
+        phase_start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            duration = time.perf_counter() - phase_start
+            self.timers[phase_name] = self.timers.get(phase_name, 0.0) + duration
+            if self.callback is not None:
+                self.callback(phase_name, duration, self)
+
+
+    def count(self, counter_name, amount=1):
+        self.counters[counter_name] = self.counters.get(counter_name, 0) + int(amount)
+
+
+    def record_triples(self, triples):
+        ##### Triple statistics are computed at once from the structured array.
+        match_lengths = triples['match_length']
+        self.count('triples', len(triples))
+        self.count('literal_triples', np.count_nonzero(match_lengths == 0))
+        self.count('matched_bytes', match_lengths.sum(dtype=np.int64))
+
+        ##### Accumulate match length histogram, growing it if longer matches were found.
+        histogram = np.bincount(match_lengths)
+        if len(histogram) > len(self.match_length_histogram):
+            self.match_length_histogram = np.pad(self.match_length_histogram, (0, len(histogram) - len(self.match_length_histogram)))
+        self.match_length_histogram[:len(histogram)] += histogram
+
+
+    def to_dict(self):
+        triples_amount = self.counters.get('triples', 0)
+        average_match_length = self.counters.get('matched_bytes', 0) / triples_amount if triples_amount else 0.0
+        return {'timers': dict(self.timers), 'counters': dict(self.counters), 'average_match_length': average_match_length,
+                'match_length_histogram': {int(length): int(count) for length, count in enumerate(self.match_length_histogram) if count}}
+
+
+    def dump(self, stats_file_path):
+        with open(stats_file_path, "w") as stats_file:
+            json.dump(self.to_dict(), stats_file, indent=4)
+
+
+
+########## Auxiliary Methods
+
+def measure(stats, phase_name):
+    ##### Phase timer of the given statistics, if there are any.
+    return NO_PHASE if stats is None else stats.phase(phase_name)
@@ -0,0 +1,89 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+
+from client import CompressionClient
+from protocol import DEFAULT_HOST, DEFAULT_PORT
+
+
+##### Sizes of the generated payloads, in bytes.
+PAYLOAD_SIZES = [256, 1024, 4096, 16384]
+PAYLOAD_SEED = 77
+WORDS = ['request', 'served', 'cache', 'miss', 'worker', 'started', 'connection', 'closed', 'retrying', 'job', 'after', 'timeout']
+
+
+########## Load Generation
+
+def generate_payloads(payloads_amount):
+    ##### Log-like payloads of several sizes, generated from a fixed seed.
+    rng = np.random.default_rng(PAYLOAD_SEED)
+    payloads = []
+    for _ in range(payloads_amount):
+        size = int(rng.choice(PAYLOAD_SIZES))
+        words = rng.choice(WORDS, size=size // 4)
+        payloads.append(' '.join(f'{word} {number}' for word, number in zip(words, rng.integers(0, 1000, size=len(words)))).encode()[:size])
+    return payloads
+
+
+async def run_connection(address, payloads, concurrency, latencies, responses):
+    ##### Each connection keeps 'concurrency' round trips in flight, taking payloads from a shared iterator.
+    async with CompressionClient(*address) as client:
+        async def round_trips():
+            for payload in payloads:
+                request_start = time.perf_counter()
+                binary_data, encode_response = await client.encode(payload)
+                decoded_payload, decode_response = await client.decode(binary_data)
+                latencies.append(time.perf_counter() - request_start)
+                responses.extend([encode_response, decode_response])
+                assert decoded_payload == payload, "Decoded payload does not match the original one."
+
+        await asyncio.gather(*[round_trips() for _ in range(concurrency)])
+
+
+async def run_load_test(address, payloads, connections, concurrency):
+    latencies, responses = [], []
+    payloads_iterator = iter(payloads)
+
+    test_start = time.perf_counter()
+    await asyncio.gather(*[run_connection(address, payloads_iterator, concurrency, latencies, responses) for _ in range(connections)])
+    test_seconds = time.perf_counter() - test_start
+
+    ##### Summarize latencies of the round trips and the statistics of the responses.
+    latencies = np.array(latencies) * 1000
+    payload_bytes = sum(len(payload) for payload in payloads)
+    encode_responses = responses[0::2]
+    return {'round_trips': len(latencies), 'seconds': test_seconds, 'round_trips_per_second': len(latencies) / test_seconds,
+            'MBps': payload_bytes / 1e6 / test_seconds,
+            'compression_ratio': payload_bytes / sum(response['output_bytes'] for response in encode_responses),
+            'latency_ms': {f'p{percentile}': float(np.percentile(latencies, percentile)) for percentile in [50, 95, 99]},
+            'average_batch_size': float(np.mean([response['batch_size'] for response in responses])),
+            'average_service_ms': 1000 * float(np.mean([response['service_seconds'] for response in responses])),
+            'workers': len({response['worker'] for response in responses})}
+
+
+
+if __name__ == "__main__":
+    ##### Receives load parameters from command line.
+    parser = argparse.ArgumentParser(description="Sends encoding and decoding round trips to a running compression server.")
+
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Server address.')
+    parser.add_argument('--port', default=DEFAULT_PORT, type=int, help='Server TCP port.')
+    parser.add_argument('--unix_socket', help='Path of the server Unix socket, instead of a TCP port.')
+    parser.add_argument('--payloads', default=1000, type=int, help='Amount of payloads encoded and decoded.')
+    parser.add_argument('--connections', default=4, type=int, help='Amount of client connections.')
+    parser.add_argument('--concurrency', default=8, type=int, help='Round trips in flight on each connection.')
+    parser.add_argument('--output', help='Path to save the results as JSON.')
+
+    ##### Read command line
+    args = parser.parse_args(sys.argv[1:])
+
+    ##### Run load test and print results.
+    results = asyncio.run(run_load_test((args.host, args.port, args.unix_socket), generate_payloads(args.payloads),
+                                        args.connections, args.concurrency))
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
@@ -0,0 +1,36 @@
+import sys
+import argparse
+import importlib
+
+
+##### Subcommands and the modules implementing them. Each module has a 'create_parser' and a 'main' function.
+SUBCOMMANDS = {'encode': ('encoder', 'Encode a file into a binary file.'),
+               'decode': ('decoder', 'Decode a binary file.'),
+               'roundtrip': ('file_coding_with_LZ77', 'Encode and decode a file, comparing the achieved rate with the entropy.'),
+               'train': ('dictionary', 'Train a preset dictionary from sample files.'),
+               'bench': ('benchmark', 'Benchmark coding throughput on a generated corpus, or the startup time of the subcommands.')}
+
+
+########## Unified Command Line
+
+# NOTE: Only the module of the chosen subcommand is imported, after the subcommand is read. So the help
+#       message is shown without importing the coders, and each subcommand only loads what it uses.
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    ##### Read subcommand. Its own arguments are left to the parser of its module.
+    parser = argparse.ArgumentParser(prog='lz77', description="LZ77 coding of text, image and raw files.")
+    subparsers = parser.add_subparsers(dest='subcommand', metavar='<subcommand>', required=True)
+    for subcommand, (_, help_message) in SUBCOMMANDS.items():
+        subparsers.add_parser(subcommand, help=help_message, add_help=False)
+    args, subcommand_argv = parser.parse_known_args(argv[:1])
+
+    ##### Import subcommand module and run it.
+    module = importlib.import_module(SUBCOMMANDS[args.subcommand][0])
+    module.main(module.create_parser(prog=f'lz77 {args.subcommand}').parse_args(subcommand_argv + argv[1:]))
+
+
+
+if __name__ == "__main__":
+    main()
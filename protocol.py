@@ -0,0 +1,35 @@
+import json
+import struct
+
+
+########## Compression Service Protocol
+
+# NOTE: Requests and responses are frames made of the length of a JSON header, the length of a binary body,
+#       the header and the body. Requests have an id, an operation and its parameters, and their body is the
+#       content to be encoded or decoded. Responses have the id of their request, its status and statistics,
+#       and their body is the result. Responses may be sent out of order, so they are matched by id.
+
+OPERATIONS = ['encode', 'decode']
+FRAME_FORMAT = '>II'
+FRAME_SIZE = struct.calcsize(FRAME_FORMAT)
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7777
+
+
+def pack_frame(header, body=b''):
+    header = json.dumps(header).encode()
+    return struct.pack(FRAME_FORMAT, len(header), len(body)) + header + body
+
+
+async def read_frame(reader):
+    ##### Returns None if the connection was closed between frames.
+    frame_start = await reader.read(FRAME_SIZE)
+    if not frame_start:
+        return None
+    frame_start += await reader.readexactly(FRAME_SIZE - len(frame_start))
+
+    header_length, body_length = struct.unpack(FRAME_FORMAT, frame_start)
+    header = json.loads(await reader.readexactly(header_length))
+    body = await reader.readexactly(body_length)
+
+    return header, body
@@ -0,0 +1,181 @@
+import os
+import json
+import struct
+import hashlib
+import tempfile
+
+from collections import OrderedDict
+
+from container import FORMAT_VERSION
+
+
+##### Default bounds of the cached results, in bytes.
+CACHE_SIZE = 1 << 30
+MEMORY_CACHE_SIZE = 1 << 26
+
+# NOTE: Each entry file has a magic number, the block type and the amount of bits of the encoded block,
+#       followed by its bytes. Entries are named by their key, in directories named by its first two digits.
+ENTRY_MAGIC_NUMBER = b'LZRC'
+ENTRY_HEADER_FORMAT = '>4sBQ'
+ENTRY_HEADER_SIZE = struct.calcsize(ENTRY_HEADER_FORMAT)
+
+
+########## Result Cache Class
+
+# NOTE: Results are addressed by a hash of the block, the symbols primed before it, the encoding parameters
+#       and the binary file format version, so any change to them is a different entry. Entries are kept in
+#       memory and, optionally, in a directory shared by concurrent processes. Files are written to a temporary
+#       file and renamed, so other processes never read partial entries. Reading an entry updates its
+#       modification time, and the least recently used entries are removed when the directory gets too large.
+
+class ResultCache():
+
+    def __init__(self, directory=None, max_size=CACHE_SIZE, max_memory_size=MEMORY_CACHE_SIZE):
+        ##### Cache bounds. Without a directory, results are only kept in memory.
+        self.directory = directory
+        self.max_size = max_size
+        self.max_memory_size = max_memory_size
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        ##### Size of the directory, counted when it is first written and updated by this process since then.
+        self.disk_size = None
+        ##### Entries kept in memory, from the least to the most recently used.
+        self.memory_entries = OrderedDict()
+        self.memory_size = 0
+        ##### Cache metrics.
+        self.metrics = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+
+    def get_key(self, block, history, parameters):
+        ##### Hash of the format version, parameters and lengths, followed by the history and the block.
+        key_hash = hashlib.blake2b(digest_size=20)
+        key_hash.update(json.dumps([FORMAT_VERSION, parameters, len(history), len(block)]).encode())
+        key_hash.update(history)
+        key_hash.update(block)
+        return key_hash.hexdigest()
+
+
+    def get(self, key):
+        ##### Look for the entry in memory, and then in the directory.
+        if key in self.memory_entries:
+            self.memory_entries.move_to_end(key)
+            self.metrics['memory_hits'] += 1
+            return self.memory_entries[key]
+
+        entry = self.__read_entry(key) if self.directory is not None else None
+        if entry is None:
+            self.metrics['misses'] += 1
+            return None
+
+        self.metrics['disk_hits'] += 1
+        self.__keep_in_memory(key, entry)
+        return entry
+
+
+    def put(self, key, block_type, block_bytes, bits_amount):
+        entry = (block_type, block_bytes, bits_amount)
+        self.metrics['stores'] += 1
+        self.__keep_in_memory(key, entry)
+        if self.directory is not None:
+            entry_size = self.__write_entry(key, entry)
+            ##### The directory is only listed when it may be too large, since other processes also write to it.
+            if self.disk_size is None or self.disk_size + entry_size > self.max_size:
+                self.__evict_entries()
+            else:
+                self.disk_size += entry_size
+
+
+    def get_metrics(self):
+        ##### Hit rate over all lookups, and size of the entries in memory.
+        hits = self.metrics['memory_hits'] + self.metrics['disk_hits']
+        lookups = hits + self.metrics['misses']
+        return dict(self.metrics, hit_rate=hits / lookups if lookups else 0.0, memory_size=self.memory_size)
+
+
+    def __getstate__(self):
+        ##### Worker processes only share the directory. Their entries in memory and metrics are their own.
+        return dict(self.__dict__, memory_entries=OrderedDict(), memory_size=0, metrics=dict.fromkeys(self.metrics, 0))
+
+
+
+    ########## Private Methods
+
+    def __get_entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+
+    def __keep_in_memory(self, key, entry):
+        ##### Entries larger than the memory bound are only kept in the directory.
+        entry_size = len(entry[1])
+        if entry_size > self.max_memory_size:
+            return
+        if key in self.memory_entries:
+            self.memory_size -= len(self.memory_entries.pop(key)[1])
+        self.memory_entries[key] = entry
+        self.memory_size += entry_size
+
+        ##### Drop the least recently used entries.
+        while self.memory_size > self.max_memory_size:
+            _, (_, block_bytes, _) = self.memory_entries.popitem(last=False)
+            self.memory_size -= len(block_bytes)
+
+
+    def __read_entry(self, key):
+        ##### Entries may be removed by other processes at any time, in which case they are missing.
+        entry_path = self.__get_entry_path(key)
+        try:
+            with open(entry_path, "rb") as entry_file:
+                entry_data = entry_file.read()
+            os.utime(entry_path)
+        except FileNotFoundError:
+            return None
+
+        ##### Entries of other formats are ignored.
+        if len(entry_data) < ENTRY_HEADER_SIZE:
+            return None
+        magic_number, block_type, bits_amount = struct.unpack_from(ENTRY_HEADER_FORMAT, entry_data)
+        if magic_number != ENTRY_MAGIC_NUMBER or len(entry_data) - ENTRY_HEADER_SIZE != (bits_amount + 7) // 8:
+            return None
+
+        return block_type, entry_data[ENTRY_HEADER_SIZE:], bits_amount
+
+
+    def __write_entry(self, key, entry):
+        ##### Write the entry to a temporary file in the same directory, and rename it to the entry path at once.
+        block_type, block_bytes, bits_amount = entry
+        entry_path = self.__get_entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), prefix='.', suffix='.tmp')
+        with os.fdopen(file_descriptor, "wb") as entry_file:
+            entry_size = entry_file.write(struct.pack(ENTRY_HEADER_FORMAT, ENTRY_MAGIC_NUMBER, block_type, bits_amount) + block_bytes)
+        os.replace(temporary_path, entry_path)
+        return entry_size
+
+
+    def __evict_entries(self):
+        ##### List entries with their size and last use. Temporary files of other processes are not entries.
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    entry_stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+
+        ##### Remove the least recently used entries until the directory fits its bound.
+        cache_size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, entry_path in sorted(entries):
+            if cache_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+                self.metrics['evictions'] += 1
+            except FileNotFoundError:
+                pass
+            cache_size -= entry_size
+        self.disk_size = cache_size
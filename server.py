@@ -0,0 +1,257 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+from concurrent.futures import ProcessPoolExecutor
+
+from encoder import Encoder
+from decoder import Decoder
+from instrumentation import CodingStats
+from protocol import pack_frame, read_frame, OPERATIONS, DEFAULT_HOST, DEFAULT_PORT
+
+
+##### Encoding parameters used when a request does not set them. Small payloads favour large buffers and hash chains.
+ENCODING_PARAMETERS = {'search_buffer_size': 4095, 'look_ahead_buffer_size': 255, 'second_encoding_step': False,
+                       'match_finder': 'hash_chain', 'chain_depth': 256, 'entropy_coder': 'canonical', 'encoding_format': 'bits'}
+BATCH_SIZE = 16
+BATCH_DELAY = 0.002
+MAX_PENDING_REQUESTS = 256
+WARM_UP_PAYLOAD = b'warm up the LZ77 workers ' * 8
+
+
+########## Request Processing
+
+# NOTE: These functions run in the worker processes. Requests are sent in batches, so the cost of
+#       sending work to a process is paid once per batch instead of once per request.
+
+def process_batch(requests):
+    return [process_request(*request) for request in requests]
+
+
+def process_request(operation, parameters, body):
+    ##### Errors are reported in the response, so they do not affect the other requests of the batch.
+    service_start = time.perf_counter()
+    try:
+        assert operation in OPERATIONS, f"Operation must be one of {OPERATIONS}."
+        stats = CodingStats() if parameters.get('stats') else None
+        result = encode_buffer(body, parameters, stats) if operation == 'encode' else decode_buffer(body, stats)
+    except Exception as error:
+        return {'status': 'error', 'error': f'{type(error).__name__}: {error}', 'worker': os.getpid()}, b''
+
+    ##### Per-request statistics.
+    response = {'status': 'ok', 'worker': os.getpid(), 'input_bytes': len(body), 'output_bytes': len(result),
+                'service_seconds': time.perf_counter() - service_start}
+    if stats is not None:
+        response['stats'] = stats.to_dict()
+
+    return response, result
+
+
+def encode_buffer(buffer, parameters, stats=None):
+    unknown_parameters = set(parameters) - set(ENCODING_PARAMETERS) - {'stats'}
+    assert not unknown_parameters, f"Unknown encoding parameters: {sorted(unknown_parameters)}."
+    parameters = {name: parameters.get(name, value) for name, value in ENCODING_PARAMETERS.items()}
+
+    encoder = Encoder(None, stats=stats, buffer=buffer)
+    encoder.encode_sequence(parameters['search_buffer_size'], parameters['look_ahead_buffer_size'], parameters['second_encoding_step'],
+                            parameters['match_finder'], parameters['chain_depth'], parameters['entropy_coder'],
+                            encoding_format=parameters['encoding_format'])
+    return encoder.get_binary_data()
+
+
+def decode_buffer(binary_data, stats=None):
+    decoder = Decoder(None, stats, binary_data=binary_data)
+    decoder.decode_bitstring()
+    return bytes(decoder.sequence)
+
+
+def warm_up_worker():
+    ##### Run a small round trip, so the first request of each worker does not pay for the first use of the coders.
+    decode_buffer(encode_buffer(WARM_UP_PAYLOAD, {}))
+    return os.getpid()
+
+
+
+########## Compression Server Class
+
+# NOTE: Connections put their requests in a bounded queue. When it is full, connections stop reading
+#       requests until there is room again, so clients are slowed down instead of the server growing
+#       without bound. Batches are taken from the queue and at most two per worker are in the pool at once.
+
+class CompressionServer():
+
+    def __init__(self, workers=os.cpu_count(), batch_size=BATCH_SIZE, batch_delay=BATCH_DELAY, max_pending_requests=MAX_PENDING_REQUESTS):
+        ##### Service parameters.
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_pending_requests = max_pending_requests
+        ##### Service counters.
+        self.counters = {'requests': 0, 'errors': 0, 'batches': 0}
+
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None):
+        ##### Start the worker processes. Warm-up tasks are submitted at once, so every worker is started by them.
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, warm_up_worker) for _ in range(self.workers)])
+
+        ##### Start batching requests.
+        self.queue = asyncio.Queue(maxsize=self.max_pending_requests)
+        self.batch_slots = asyncio.Semaphore(2 * self.workers)
+        ##### Batches being processed. Their tasks are kept until they are done, so they are not garbage collected.
+        self.batch_tasks = set()
+        ##### Requests of the batch being gathered, which are processed by 'close' if it is cancelled.
+        self.gathered_requests = []
+        self.closing = False
+        self.batcher = asyncio.create_task(self.__batch_requests())
+
+        ##### Listen on a Unix socket or a TCP port.
+        if unix_socket:
+            self.server = await asyncio.start_unix_server(self.__handle_connection, path=unix_socket)
+        else:
+            self.server = await asyncio.start_server(self.__handle_connection, host, port)
+
+        return self.server
+
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+
+    async def close(self):
+        ##### Stop accepting connections. Requests received from now on are answered with an error.
+        self.closing = True
+        self.server.close()
+        await self.server.wait_closed()
+
+        ##### Stop batching. The batch being gathered and the queued requests are still processed, and batches
+        #     in the pool are finished, before the workers are stopped. Connections waiting for room in the queue
+        #     add their requests meanwhile, so this goes on until the queue stays empty.
+        self.batcher.cancel()
+        await asyncio.gather(self.batcher, return_exceptions=True)
+        requests = self.gathered_requests
+        while requests or self.batch_tasks or not self.queue.empty():
+            while not self.queue.empty():
+                requests.append(self.queue.get_nowait())
+            for batch_start in range(0, len(requests), self.batch_size):
+                await self.batch_slots.acquire()
+                self.__start_batch(requests[batch_start:batch_start + self.batch_size])
+            requests = []
+            await asyncio.gather(*self.batch_tasks)
+
+        self.executor.shutdown()
+
+
+
+    ########## Private Methods
+
+    async def __handle_connection(self, reader, writer):
+        ##### Each request is answered by its own task, as soon as it is processed.
+        response_tasks = set()
+        try:
+            frame = await read_frame(reader)
+            while frame is not None:
+                request, body = frame
+                future = asyncio.get_running_loop().create_future()
+                if self.closing:
+                    future.set_result(({'status': 'error', 'error': 'Server is closing.', 'id': request.get('id')}, b''))
+                ##### Waits while the queue is full, which stops reading from this connection.
+                else:
+                    await self.queue.put((request, body, future, time.perf_counter()))
+                response_task = asyncio.create_task(self.__send_response(writer, future))
+                response_tasks.add(response_task)
+                response_task.add_done_callback(response_tasks.discard)
+                frame = await read_frame(reader)
+        ##### Clients may close the connection in the middle of a frame.
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            ##### Answer pending requests before closing the connection. Responses to broken connections are dropped.
+            await asyncio.gather(*response_tasks, return_exceptions=True)
+            writer.close()
+
+
+    async def __send_response(self, writer, future):
+        response, body = await future
+        ##### Each frame is written at once, so frames of concurrent responses are not mixed.
+        writer.write(pack_frame(response, body))
+        await writer.drain()
+
+
+    async def __batch_requests(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            ##### Wait for a request, and then for more requests until the batch is full or the delay is over.
+            batch = self.gathered_requests = [await self.queue.get()]
+            batch_deadline = loop.time() + self.batch_delay
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                remaining_delay = batch_deadline - loop.time()
+                if remaining_delay <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining_delay))
+                except asyncio.TimeoutError:
+                    break
+
+            ##### Waits while the pool is busy, so the queue fills up and connections are slowed down.
+            await self.batch_slots.acquire()
+            self.__start_batch(batch)
+            self.gathered_requests = []
+
+
+    def __start_batch(self, batch):
+        batch_task = asyncio.create_task(self.__run_batch(batch))
+        self.batch_tasks.add(batch_task)
+        batch_task.add_done_callback(self.batch_tasks.discard)
+
+
+    async def __run_batch(self, batch):
+        ##### Process batch in a worker.
+        requests = [(request.get('operation'), request.get('parameters', {}), body) for request, body, _, _ in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, process_batch, requests)
+        except Exception as error:
+            results = [({'status': 'error', 'error': f'{type(error).__name__}: {error}'}, b'')] * len(batch)
+        finally:
+            self.batch_slots.release()
+
+        ##### Complete responses with the queueing statistics.
+        batch_finish = time.perf_counter()
+        self.counters['batches'] += 1
+        for (request, _, future, arrival), (response, result) in zip(batch, results):
+            self.counters['requests'] += 1
+            self.counters['errors'] += response['status'] != 'ok'
+            response = dict(response, id=request.get('id'), batch_size=len(batch), total_seconds=batch_finish - arrival)
+            future.set_result((response, result))
+
+
+
+if __name__ == "__main__":
+    ##### Receives service parameters from command line.
+    parser = argparse.ArgumentParser(description="Serves LZ77 encoding and decoding requests with a pool of warm worker processes.")
+
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Address to listen on.')
+    parser.add_argument('--port', default=DEFAULT_PORT, type=int, help='TCP port to listen on.')
+    parser.add_argument('--unix_socket', help='Path of a Unix socket to listen on, instead of a TCP port.')
+    parser.add_argument('--workers', default=os.cpu_count(), type=int, help='Amount of worker processes.')
+    parser.add_argument('--batch_size', default=BATCH_SIZE, type=int, help='Largest amount of requests sent to a worker at once.')
+    parser.add_argument('--batch_delay', default=BATCH_DELAY, type=float, help='Seconds waited for more requests before sending a batch.')
+    parser.add_argument('--max_pending_requests', default=MAX_PENDING_REQUESTS, type=int, help='Requests queued before connections are slowed down.')
+
+    ##### Read command line
+    args = parser.parse_args(sys.argv[1:])
+
+    async def main():
+        server = CompressionServer(args.workers, args.batch_size, args.batch_delay, args.max_pending_requests)
+        await server.start(args.host, args.port, args.unix_socket)
+        print(f"Serving on {args.unix_socket or f'{args.host}:{args.port}'} with {args.workers} workers.", flush=True)
+        await server.serve_forever()
+
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+import numpy as np
+
+
+########## Suffix Array Match Finder
+
+# NOTE: The longest match of every position is found at once, from the suffix array of the sequence.
+#       Among the suffixes starting before a position, the ones sharing the longest prefix with it are its
+#       closest previous and next neighbours in the suffix array that start before it. Prefixes are compared
+#       with the ranks of the prefix doubling, so no step depends on the length of the matches, and memory
+#       usage is proportional to the sequence length times its logarithm.
+
+def find_longest_previous_matches(sequence, search_buffer_size, look_ahead_buffer_size, start=0):
+    ##### Position and length of the longest match of each position from 'start', within the search buffer.
+    sequence = np.frombuffer(bytes(sequence), dtype=np.uint8)
+    sequence_length = len(sequence)
+    if sequence_length <= search_buffer_size + 1:
+        return find_longest_previous_factors(sequence)
+
+    ##### Longer sequences are split in segments of half the search buffer, each one matched in two windows
+    #     that go a look ahead buffer beyond it, so matches are not cut at its end. The first window starts
+    #     at the previous segment, so all its candidates are within the search buffer, but the first positions
+    #     of the segment only see half of it. The second one starts a whole search buffer before the segment,
+    #     and its candidates beyond the search buffer are discarded. The longest match of both is kept.
+    match_positions = np.full(sequence_length, -1, dtype=np.int64)
+    match_lengths = np.zeros(sequence_length, dtype=np.int64)
+    segment_size = max(search_buffer_size // 2, 1)
+    for segment_start in range(start - start % segment_size, sequence_length, segment_size):
+        segment = slice(segment_start, min(segment_start + segment_size, sequence_length))
+        window_end = min(segment.stop + look_ahead_buffer_size, sequence_length)
+        for window_start in dict.fromkeys([max(segment_start - segment_size, 0), max(segment_start - search_buffer_size, 0)]):
+            window_positions, window_lengths = find_longest_previous_factors(sequence[window_start:window_end], search_buffer_size)
+
+            ##### Ties keep the match of the first window.
+            window_segment = slice(segment.start - window_start, segment.stop - window_start)
+            longer = window_lengths[window_segment] > match_lengths[segment]
+            match_positions[segment] = np.where(longer, window_positions[window_segment] + window_start, match_positions[segment])
+            match_lengths[segment] = np.where(longer, window_lengths[window_segment], match_lengths[segment])
+
+    return match_positions, match_lengths
+
+
+def find_longest_previous_factors(sequence, search_buffer_size=None):
+    ##### Position and length of the longest match of each position with any previous one, within the
+    #     search buffer if given.
+    suffix_array, rank_levels = build_suffix_array(sequence)
+    sequence_positions = np.arange(len(sequence))
+
+    ##### Neighbours of each suffix starting before it, given by their positions in the suffix array.
+    previous_neighbours, next_neighbours = find_nearest_smaller_values(suffix_array)
+    suffix_ranks = np.empty_like(suffix_array)
+    suffix_ranks[suffix_array] = np.arange(len(suffix_array), dtype=suffix_array.dtype)
+
+    ##### Compare each position with both neighbours. Ties keep the closest position.
+    match_positions = np.full(len(sequence), -1, dtype=np.int64)
+    match_lengths = np.zeros(len(sequence), dtype=np.int64)
+    for neighbours in [previous_neighbours, next_neighbours]:
+        neighbours = neighbours[suffix_ranks]
+        candidate_positions = np.where(neighbours >= 0, suffix_array[np.maximum(neighbours, 0)], -1)
+        if search_buffer_size is not None:
+            candidate_positions[candidate_positions < sequence_positions - search_buffer_size] = -1
+        candidate_lengths = compute_common_prefix_lengths(rank_levels, sequence_positions, candidate_positions)
+        longer = (candidate_lengths > match_lengths) | ((candidate_lengths == match_lengths) & (candidate_positions > match_positions))
+        longer &= candidate_lengths > 0
+        match_positions[longer] = candidate_positions[longer]
+        match_lengths[longer] = candidate_lengths[longer]
+
+    return match_positions, match_lengths
+
+
+def build_suffix_array(sequence):
+    ##### Suffixes are sorted by prefixes twice as long at each step, from the ranks of the previous step.
+    #     Positions after the end have the null rank, and symbols start at one.
+    sequence_length = len(sequence)
+    ranks = sequence.astype(np.int64) + 1
+    rank_levels = [ranks.astype(np.int32)]
+    suffix_array = np.argsort(ranks, kind='stable').astype(np.int32)
+    prefix_length = 1
+
+    while prefix_length < sequence_length:
+        ##### Sort by the pair of ranks of both halves of each prefix, packed in an integer.
+        second_ranks = np.zeros(sequence_length, dtype=np.int64)
+        second_ranks[:sequence_length - prefix_length] = ranks[prefix_length:]
+        keys = ranks * (max(sequence_length, 256) + 1) + second_ranks
+        suffix_array = np.argsort(keys).astype(np.int32)
+
+        ##### Equal pairs share their rank.
+        sorted_keys = keys[suffix_array]
+        sorted_ranks = np.cumsum(np.append(1, sorted_keys[1:] != sorted_keys[:-1]))
+        ranks = np.empty(sequence_length, dtype=np.int64)
+        ranks[suffix_array] = sorted_ranks
+        rank_levels.append(ranks.astype(np.int32))
+        prefix_length *= 2
+
+        ##### Suffixes are sorted when all ranks are distinct.
+        if sorted_ranks[-1] == sequence_length:
+            break
+
+    return suffix_array, rank_levels
+
+
+def compute_common_prefix_lengths(rank_levels, first_positions, second_positions):
+    ##### Prefixes of 2^level symbols are equal when their ranks are. Common prefixes are shorter than the
+    #     prefixes of the last level, so they are found by trying each shorter power of two, from the longest.
+    sequence_length = len(rank_levels[0])
+    valid = second_positions >= 0
+    lengths = np.zeros(len(first_positions), dtype=np.int64)
+    for level in reversed(range(len(rank_levels) - 1)):
+        first_starts, second_starts = first_positions + lengths, second_positions + lengths
+        in_sequence = valid & (first_starts < sequence_length) & (second_starts < sequence_length)
+        level_ranks = rank_levels[level]
+        equal = in_sequence & (level_ranks[np.minimum(first_starts, sequence_length - 1)] ==
+                               level_ranks[np.clip(second_starts, 0, sequence_length - 1)])
+        lengths += equal.astype(np.int64) << level
+
+    return lengths
+
+
+def find_nearest_smaller_values(values):
+    ##### Closest previous and next indices with a smaller value, or -1. Values must be distinct.
+    #     Minimums of ranges of 2^level values are used to skip ranges with larger values at once.
+    values_amount = len(values)
+    range_minimums = [values]
+    while (1 << len(range_minimums)) <= values_amount:
+        half = 1 << (len(range_minimums) - 1)
+        range_minimums.append(np.minimum(range_minimums[-1][:-half], range_minimums[-1][half:]))
+
+    ##### Extend ranges of larger values to the left and to the right of each index.
+    indices = np.arange(values_amount)
+    range_starts, range_ends = indices.copy(), indices + 1
+    for level in reversed(range(len(range_minimums))):
+        level_minimums, step = range_minimums[level], 1 << level
+        starts = range_starts - step
+        skip = (starts >= 0) & (level_minimums[np.maximum(starts, 0)] > values)
+        range_starts[skip] = starts[skip]
+        skip = (range_ends + step <= values_amount) & (level_minimums[np.minimum(range_ends, len(level_minimums) - 1)] > values)
+        range_ends[skip] += step
+
+    return range_starts - 1, np.where(range_ends < values_amount, range_ends, -1)
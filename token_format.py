@@ -0,0 +1,162 @@
+import numpy as np
+
+from expansion import iter_expanded_runs
+
+
+########## Byte-Aligned Token Format
+
+# NOTE: As in LZ4, the sequence is written as runs of literals, each one followed by a match. Every run
+#       has a token byte: the literal run length in the high nibble and the match length, minus the minimum
+#       match length, in the low nibble. Nibbles equal to 15 are extended by a varint. The last run has no
+#       match. Tokens, extensions, offsets and literals are written as separate streams, so the fields of many
+#       runs are parsed at once and decoding only copies literals and matches.
+#
+#       Payload: offset bytes amount (1 byte), runs amount (varint), extensions length (varint), tokens,
+#       extensions, little endian offsets and literals.
+
+MIN_MATCH_LENGTH = 4
+NIBBLE_MAX = 15
+VARINT_MAX_BYTES = 10
+##### Amount of runs parsed at once when expanding tokens in chunks.
+RUNS_PER_CHUNK = 1 << 16
+
+
+def get_offset_bytes_amount(max_offset):
+    ##### Offsets take 16 bits for windows up to 64 KB and 24 bits for windows up to 16 MB.
+    for offset_bytes_amount in [2, 3]:
+        if max_offset < 1 << (8 * offset_bytes_amount):
+            return offset_bytes_amount
+    return 4
+
+
+def write_tokens(triples, sequence):
+    sequence = np.frombuffer(memoryview(sequence).cast('B'), dtype=np.uint8)
+    offsets, match_lengths = triples['offset'].astype(np.int64), triples['match_length'].astype(np.int64)
+
+    ##### Matches shorter than the minimum cost more than their symbols, so they are kept as literals.
+    triple_starts = np.cumsum(match_lengths + 1) - (match_lengths + 1)
+    kept_matches = match_lengths >= MIN_MATCH_LENGTH
+    match_starts, match_lengths, offsets = triple_starts[kept_matches], match_lengths[kept_matches], offsets[kept_matches]
+    match_ends = match_starts + match_lengths
+
+    ##### Each run has the literals between the previous match and its own. The last run only has literals.
+    literal_counts = np.append(match_starts, len(sequence)) - np.append(0, match_ends)
+    match_extensions = np.append(match_lengths - MIN_MATCH_LENGTH, 0)
+    covered = np.cumsum(np.bincount(match_starts, minlength=len(sequence) + 1) - np.bincount(match_ends, minlength=len(sequence) + 1))
+    literals = sequence[covered[:len(sequence)] == 0]
+
+    ##### Write tokens and the extensions of saturated nibbles, in the order of the runs.
+    tokens = (np.minimum(literal_counts, NIBBLE_MAX) << 4) | np.minimum(match_extensions, NIBBLE_MAX)
+    extensions = np.column_stack((literal_counts, match_extensions)).ravel() - NIBBLE_MAX
+    extensions = write_varints(extensions[extensions >= 0])
+
+    ##### Write payload.
+    offset_bytes_amount = get_offset_bytes_amount(int(offsets.max(initial=0)))
+    payload = bytearray([offset_bytes_amount])
+    write_varint(payload, len(tokens))
+    write_varint(payload, len(extensions))
+    for stream in [tokens.astype(np.uint8), extensions, write_fields(offsets, offset_bytes_amount), literals]:
+        payload += stream.tobytes()
+
+    return payload
+
+
+def expand_tokens(tokens, history=b''):
+    ##### Decoded symbols, expanded after the given history, which may hold the primed symbols.
+    return b''.join(iter_expanded_tokens(tokens, history, len(history)))
+
+
+def iter_expanded_tokens(tokens, history, history_size, chunk_size=None):
+    ##### Runs are parsed in chunks, so only the fields of one chunk of runs are in memory at once.
+    return iter_expanded_runs(iter_runs(tokens), history, history_size, chunk_size)
+
+
+def iter_runs(tokens, runs_per_chunk=RUNS_PER_CHUNK):
+    ##### Read payload header and split streams.
+    tokens = memoryview(tokens).cast('B')
+    offset_bytes_amount = tokens[0]
+    runs_amount, index = read_varint(tokens, 1)
+    extensions_length, index = read_varint(tokens, index)
+    offsets_start = index + runs_amount + extensions_length
+    literals_start = offsets_start + (runs_amount - 1) * offset_bytes_amount
+    run_tokens, extensions = tokens[index:index + runs_amount], tokens[index + runs_amount:offsets_start]
+    offsets, literals = tokens[offsets_start:literals_start], tokens[literals_start:]
+
+    ##### Streams are read from the end of the previous chunk. Only the last run has no match.
+    extensions_position = literals_position = 0
+    for runs_start in range(0, runs_amount, runs_per_chunk):
+        runs_end = min(runs_start + runs_per_chunk, runs_amount)
+        chunk_tokens = np.frombuffer(run_tokens[runs_start:runs_end], dtype=np.uint8).astype(np.int64)
+
+        ##### Read nibbles and add the extensions of the saturated ones. Varints end with a byte lower
+        #     than 0x80 and have at most VARINT_MAX_BYTES, so the extensions of the chunk are found in a bounded slice.
+        nibbles = np.column_stack((chunk_tokens >> 4, chunk_tokens & NIBBLE_MAX)).ravel()
+        saturated = nibbles == NIBBLE_MAX
+        extensions_amount = int(np.count_nonzero(saturated))
+        if extensions_amount:
+            extension_bytes = np.frombuffer(extensions[extensions_position:extensions_position + extensions_amount * VARINT_MAX_BYTES], dtype=np.uint8)
+            extensions_end = extensions_position + int(np.flatnonzero(extension_bytes < 0x80)[extensions_amount - 1]) + 1
+            nibbles[saturated] += read_varints(extensions[extensions_position:extensions_end])
+            extensions_position = extensions_end
+        literal_counts, match_lengths = nibbles[0::2], nibbles[1::2] + MIN_MATCH_LENGTH
+
+        chunk_offsets = read_fields(offsets[runs_start * offset_bytes_amount:min(runs_end, runs_amount - 1) * offset_bytes_amount],
+                                    offset_bytes_amount)
+        if runs_end == runs_amount:
+            match_lengths[-1] = 0
+            chunk_offsets = np.append(chunk_offsets, 0)
+
+        literals_end = literals_position + int(literal_counts.sum())
+        yield literal_counts, chunk_offsets, match_lengths, literals[literals_position:literals_end]
+        literals_position = literals_end
+
+
+
+########## Auxiliary Methods
+
+def write_fields(values, bytes_amount):
+    ##### Little endian fields with the given amount of bytes.
+    return values.astype('<u4').view(np.uint8).reshape(-1, 4)[:, :bytes_amount]
+
+
+def read_fields(buffer, bytes_amount):
+    fields = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, bytes_amount)
+    return np.pad(fields, ((0, 0), (0, 4 - bytes_amount))).view('<u4').ravel().astype(np.int64)
+
+
+def write_varints(values):
+    ##### Seven bits per byte, from the lowest ones. The highest bit tells if more bytes follow.
+    groups = (values[:, None] >> (7 * np.arange(VARINT_MAX_BYTES))) & 0x7F
+    bytes_amounts = 1 + ((values[:, None] >> (7 * np.arange(1, VARINT_MAX_BYTES))) > 0).sum(axis=1)
+    used_groups = np.arange(VARINT_MAX_BYTES) < bytes_amounts[:, None]
+    continued_groups = np.arange(VARINT_MAX_BYTES) < bytes_amounts[:, None] - 1
+    return (groups | (continued_groups << 7))[used_groups].astype(np.uint8)
+
+
+def read_varints(buffer):
+    varint_bytes = np.frombuffer(buffer, dtype=np.uint8).astype(np.int64)
+    if not len(varint_bytes):
+        return varint_bytes
+
+    ##### Each varint ends with a byte lower than 0x80. Its groups are shifted by their position in it.
+    varint_starts = np.flatnonzero(np.append(True, varint_bytes[:-1] < 0x80))
+    positions = np.arange(len(varint_bytes)) - np.repeat(varint_starts, np.diff(np.append(varint_starts, len(varint_bytes))))
+    return np.add.reduceat((varint_bytes & 0x7F) << (7 * positions), varint_starts)
+
+
+def write_varint(payload, value):
+    while value >= 0x80:
+        payload.append((value & 0x7F) | 0x80)
+        value >>= 7
+    payload.append(value)
+
+
+def read_varint(payload, index):
+    value = shift = 0
+    while True:
+        byte = payload[index]
+        index += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, index
+        shift += 7
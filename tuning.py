@@ -0,0 +1,107 @@
+import time
+import numpy as np
+
+from encoder import BlockEncoder
+
+
+##### Buffer sizes searched for each engine. The window engine compares the whole search buffer
+#     at every step, so only smaller search buffers are practical with it. The suffix array engine
+#     handles the same buffer sizes as the hash chains.
+SEARCH_BUFFER_SIZES = {'window': [15, 31, 63, 127, 255, 1023],
+                       'hash_chain': [255, 1023, 4095, 16383, 65535],
+                       'suffix_array': [255, 1023, 4095, 16383, 65535]}
+LOOK_AHEAD_BUFFER_SIZES = {'window': [7, 15, 31, 63],
+                           'hash_chain': [15, 63, 255],
+                           'suffix_array': [15, 63, 255]}
+SAMPLE_SIZE = 1 << 14
+SAMPLES_AMOUNT = 4
+
+
+########## Buffer Sizes Tuning
+
+# NOTE: Configurations are evaluated on a few samples spread over the sequence. Each sample is
+#       encoded with the symbols that precede it as initial search buffer, as in the full encoding.
+
+def take_samples(sequence, history_size, sample_size=SAMPLE_SIZE, samples_amount=SAMPLES_AMOUNT):
+    ##### Short sequences are a sample by themselves. Otherwise, only the samples are copied.
+    sequence = memoryview(sequence).cast('B')
+    if len(sequence) <= sample_size * samples_amount:
+        return [(b'', bytes(sequence))]
+
+    ##### Otherwise, samples are evenly spaced. Each one is paired with the symbols that precede it.
+    sample_starts = np.linspace(0, len(sequence) - sample_size, samples_amount).astype(int).tolist()
+    return [(bytes(sequence[max(0, sample_start - history_size):sample_start]), bytes(sequence[sample_start:sample_start + sample_size]))
+            for sample_start in sample_starts]
+
+
+def evaluate_configuration(samples, search_buffer_size, look_ahead_buffer_size, second_encoding_step=False,
+                           match_finder='window', chain_depth=256, entropy_coder='canonical', encoding_format='bits'):
+    block_encoder = BlockEncoder(search_buffer_size, look_ahead_buffer_size, second_encoding_step, match_finder, chain_depth,
+                                 entropy_coder, encoding_format=encoding_format)
+
+    ##### Encode every sample after its history. The full encoding only goes through the history once,
+    #     so the time spent on it, measured by encoding a single symbol after it, is not included.
+    encoding_time = bits_amount = 0
+    for history, sample in samples:
+        history = history[max(len(history) - search_buffer_size, 0):]
+        priming_start = time.perf_counter()
+        block_encoder.encode_block(sample[:1], history)
+        encoding_start = time.perf_counter()
+        _, block_bitstring = block_encoder.encode_block(sample, history)
+        bits_amount += len(block_bitstring)
+        encoding_finish = time.perf_counter()
+        encoding_time += max((encoding_finish - encoding_start) - (encoding_start - priming_start), 0)
+
+    ##### Predict compression ratio and throughput.
+    samples_bytes = sum(len(sample) for _, sample in samples)
+    return {'search_buffer_size': search_buffer_size, 'look_ahead_buffer_size': look_ahead_buffer_size,
+            'ratio': 8 * samples_bytes / max(bits_amount, 1), 'MBps': samples_bytes / 1e6 / max(encoding_time, 1e-9)}
+
+
+def tune_buffer_sizes(sequence, second_encoding_step=False, match_finder='window', chain_depth=256, entropy_coder='canonical',
+                      workers=1, sample_size=SAMPLE_SIZE, samples_amount=SAMPLES_AMOUNT, encoding_format='bits'):
+    ##### Take samples, with enough history for the largest search buffer.
+    samples = take_samples(sequence, max(SEARCH_BUFFER_SIZES[match_finder]), sample_size, samples_amount)
+
+    ##### Define configurations grid.
+    configurations = [(search_buffer_size, look_ahead_buffer_size)
+                      for search_buffer_size in SEARCH_BUFFER_SIZES[match_finder]
+                      for look_ahead_buffer_size in LOOK_AHEAD_BUFFER_SIZES[match_finder]]
+    search_buffer_sizes, look_ahead_buffer_sizes = zip(*configurations)
+    configurations_amount = len(configurations)
+    arguments = [[samples] * configurations_amount, search_buffer_sizes, look_ahead_buffer_sizes,
+                 [second_encoding_step] * configurations_amount, [match_finder] * configurations_amount,
+                 [chain_depth] * configurations_amount, [entropy_coder] * configurations_amount,
+                 [encoding_format] * configurations_amount]
+
+    ##### Evaluate configurations, concurrently if there is more than one worker.
+    if workers == 1:
+        return list(map(evaluate_configuration, *arguments))
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(evaluate_configuration, *arguments))
+
+
+def choose_configuration(evaluations, sequence_length, time_budget=None, ratio_budget=None):
+    ##### Predict the time of the full encoding.
+    for evaluation in evaluations:
+        evaluation['predicted_seconds'] = sequence_length / 1e6 / evaluation['MBps']
+
+    def best_ratio(candidates):
+        return max(candidates, key=lambda evaluation: evaluation['ratio'])
+
+    def fastest(candidates):
+        return max(candidates, key=lambda evaluation: evaluation['MBps'])
+
+    ##### With a time budget, the best ratio among fast enough configurations is chosen.
+    if time_budget is not None:
+        candidates = [evaluation for evaluation in evaluations if evaluation['predicted_seconds'] <= time_budget]
+        return best_ratio(candidates) if candidates else fastest(evaluations)
+
+    ##### With a ratio budget, the fastest configuration reaching it is chosen.
+    if ratio_budget is not None:
+        candidates = [evaluation for evaluation in evaluations if evaluation['ratio'] >= ratio_budget]
+        return fastest(candidates) if candidates else best_ratio(evaluations)
+
+    ##### Otherwise, the best ratio is chosen.
+    return best_ratio(evaluations)